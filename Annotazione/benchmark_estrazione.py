@@ -0,0 +1,72 @@
+import contextlib
+import glob
+import io
+import json
+import os
+import sys
+import timeit
+
+from scraping import parse_product_json_ld
+
+# Directory con le pagine prodotto salvate (file .html)
+FIXTURES_DIR = os.path.join('export', 'fixtures')
+
+
+# Genera una pagina prodotto sintetica simile a quelle di WooCommerce, usata se non ci sono fixture salvate
+def synthetic_product_page(n_blocks=3000):
+    product = {
+        "@context": "https://schema.org",
+        "@graph": [
+            {"@type": "WebPage", "@id": "http://www.ethos.local/prodotto/#webpage"},
+            {
+                "@type": "Product",
+                "@id": "http://www.ethos.local/prodotto/#richSnippet",
+                "name": "Eau de Parfum 100 ml",
+                "brand": {"@type": "Brand", "name": "Brand"},
+                "offers": {"@type": "Offer", "price": "49.90", "priceCurrency": "EUR"}
+            }
+        ]
+    }
+    head = f'<script type="application/ld+json">{json.dumps(product)}</script>'
+    body = ''.join(
+        f'<div class="product-card" data-id="{i}"><a href="/p/{i}"><img src="/img/{i}.jpg" alt="Prodotto {i}">'
+        f'<span class="price">&euro; {i % 100},90</span></a><p>Descrizione &amp; note olfattive {i}</p></div>'
+        for i in range(n_blocks)
+    )
+    footer = '<script type="text/javascript">var wc_params = {"ajax_url": "/wp-admin/admin-ajax.php"};</script>'
+    return f'<!DOCTYPE html><html><head><title>Prodotto</title>{head}</head><body>{body}{footer}</body></html>'
+
+
+def load_fixtures(fixtures_dir):
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(fixtures_dir, '*.html'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            pages[os.path.basename(path)] = f.read()
+    if not pages:
+        print(f"Nessuna fixture in {fixtures_dir}, uso una pagina sintetica.")
+        pages['sintetica.html'] = synthetic_product_page()
+    return pages
+
+
+def run_benchmark(fixtures_dir=FIXTURES_DIR, repeat=5, number=10):
+    pages = load_fixtures(fixtures_dir)
+
+    for name, html in pages.items():
+        timings = {}
+        # Silenzia i messaggi di log dell'estrattore durante le misure
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = parse_product_json_ld(html, name, 'bs4')
+            for backend in ['bs4', 'stream']:
+                if parse_product_json_ld(html, name, backend) != expected:
+                    raise AssertionError(f"Il backend '{backend}' estrae prodotti diversi da bs4 per {name}")
+                runs = timeit.repeat(lambda: parse_product_json_ld(html, name, backend), repeat=repeat, number=number)
+                timings[backend] = min(runs) / number
+
+        print(f"{name} ({len(html) / 1024:.0f} KB, {len(expected)} prodotti)")
+        for backend, seconds in timings.items():
+            print(f"  {backend:<6} {seconds * 1000:8.2f} ms/pagina")
+        print(f"  speedup stream/bs4: {timings['bs4'] / timings['stream']:.1f}x")
+
+
+if __name__ == '__main__':
+    run_benchmark(sys.argv[1] if len(sys.argv) > 1 else FIXTURES_DIR)
@@ -0,0 +1,64 @@
+import json
+from concurrent.futures import ProcessPoolExecutor
+from rdflib import Graph
+from rdflib.plugins.shared.jsonld.util import source_to_json
+
+
+# Risolve un contesto JSON-LD remoto una sola volta, così i blocchi non lo riscaricano a ogni parsing
+def resolve_context(context):
+    if isinstance(context, str):
+        document = source_to_json(context)
+        # rdflib >= 7 restituisce la coppia (documento, base HTML)
+        if isinstance(document, tuple):
+            document = document[0]
+        return document['@context']
+    return context
+
+
+# Converte un blocco di nodi del @graph in testo RDF (eseguita anche nei processi worker)
+def convert_chunk(args):
+    context, nodes, rdf_format = args
+    g = Graph()
+    g.bind("schema", "http://schema.org/")
+    g.parse(data=json.dumps({"@context": context, "@graph": nodes}), format="json-ld")
+    return g.serialize(format=rdf_format)
+
+
+def convert_json_ld_to_turtle_stream(json_ld_data, output_file, chunk_size=200, workers=1, rdf_format='turtle'):
+    """
+    Converte un documento JSON-LD con @graph in Turtle (o N-Triples con rdf_format='nt')
+    elaborando `chunk_size` nodi alla volta e scrivendo ogni blocco nel file appena pronto,
+    senza costruire il grafo RDF completo in memoria. Con `workers` > 1 i blocchi vengono
+    convertiti in processi separati e concatenati nell'ordine originale.
+
+    Il risultato è isomorfo a quello della conversione dell'intero grafo, purché i nodi
+    non condividano blank node con etichetta esplicita (ad es. "_:b0") tra blocchi diversi.
+    Su Windows la modalità parallela richiede che lo script chiamante sia protetto da
+    `if __name__ == '__main__'`, perché i processi worker reimportano il modulo principale.
+    """
+    context = resolve_context(json_ld_data.get("@context"))
+    graph = json_ld_data.get("@graph", [])
+    chunks = ((context, graph[start:start + chunk_size], rdf_format)
+              for start in range(0, len(graph), chunk_size))
+
+    with open(output_file, 'w', encoding='utf-8') as f:
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for text in executor.map(convert_chunk, chunks):
+                    f.write(text)
+        else:
+            for chunk in chunks:
+                f.write(convert_chunk(chunk))
+
+
+def convert_node_groups(context, groups, workers=1, rdf_format='turtle'):
+    """
+    Converte separatamente ogni gruppo di nodi (ad esempio i prodotti di una pagina) e restituisce
+    i testi RDF nello stesso ordine, così ogni frammento può essere memorizzato e riusato da solo.
+    I frammenti si concatenano in un documento valido, come i blocchi di convert_json_ld_to_turtle_stream.
+    """
+    tasks = [(context, nodes, rdf_format) for nodes in groups]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(convert_chunk, tasks))
+    return [convert_chunk(task) for task in tasks]
@@ -1,9 +1,17 @@
 import csv
+import hashlib
 import requests
 from bs4 import BeautifulSoup
 import json
 import os
-from rdflib import Graph
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from conversione_turtle import convert_json_ld_to_turtle_stream, convert_node_groups, resolve_context
 
 # Struttura iniziale fissa con Organization e WebSite
 json_data = {
@@ -28,64 +36,289 @@ json_data = {
 }
 
 
-def extract_product_json_ld(url):
-    # Effettua la richiesta HTTP all'URL specificato
-    response = requests.get(url)
+# Manifest per il re-scraping incrementale
+MANIFEST_FILE = 'export/manifest.json'
 
-    # Verifica che la richiesta sia andata a buon fine
-    if response.status_code == 200:
+# Store append-only (JSON Lines) con i prodotti estratti nella corsa in corso
+STORE_FILE = 'export/products.jsonl'
+
+
+# Crea una sessione HTTP con connessioni keep-alive riutilizzate e retry con backoff esponenziale
+def create_session(pool_size=10, max_retries=3, backoff_factor=0.5):
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+        respect_retry_after_header=True
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# Limita la frequenza delle richieste verso lo stesso host (ritardo minimo tra due richieste)
+class HostThrottle:
+    def __init__(self, delay):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, url):
+        if self.delay <= 0:
+            return
+        host = urlparse(url).netloc
+        # Prenota lo slot successivo per l'host e attende fuori dal lock
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.delay
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# Parser a eventi che raccoglie solo il contenuto dei blocchi <script type="application/ld+json">
+class JsonLdScriptParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.in_json_ld = False
+        self.buffer = []
+        self.scripts = []
+        self.product_found = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'script' and dict(attrs).get('type') == 'application/ld+json':
+            self.in_json_ld = True
+            self.buffer = []
+
+    def handle_data(self, data):
+        if self.in_json_ld:
+            self.buffer.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == 'script' and self.in_json_ld:
+            self.in_json_ld = False
+            script = ''.join(self.buffer)
+            self.scripts.append(script)
+            # La lettura si ferma solo se il @graph del blocco contiene davvero un nodo Product:
+            # la stringa "Product" può comparire anche in un breadcrumb o in un nome
+            if '"Product"' in script and has_product_node(script):
+                self.product_found = True
+
+
+# Verifica se un blocco JSON-LD contiene un nodo Product nel @graph, come parse_product_json_ld
+def has_product_node(script):
+    try:
+        data = json.loads(script)
+    except json.JSONDecodeError:
+        return False
+    graph = data.get("@graph", []) if isinstance(data, dict) else []
+    return any(isinstance(item, dict) and item.get("@type") == "Product" for item in graph)
+
+
+def extract_json_ld_scripts(html, chunk_size=16384):
+    """
+    Restituisce i blocchi JSON-LD della pagina senza costruire l'albero DOM.
+    L'HTML viene passato al parser a blocchi e la lettura si interrompe appena
+    termina lo script che contiene il nodo Product.
+    """
+    parser = JsonLdScriptParser()
+    for start in range(0, len(html), chunk_size):
+        parser.feed(html[start:start + chunk_size])
+        if parser.product_found:
+            break
+    else:
+        parser.close()
+    return parser.scripts
+
+
+def parse_product_json_ld(html, url, parser_backend='bs4'):
+    """
+    Restituisce la lista dei nodi Product presenti nei blocchi JSON-LD della pagina.
+    `parser_backend` può essere 'bs4' (albero BeautifulSoup completo, tutti i blocchi)
+    oppure 'stream' (parser a eventi che si ferma al primo blocco con un Product).
+    """
+    if parser_backend == 'bs4':
         # Parsing dell'HTML della pagina
-        soup = BeautifulSoup(response.text, "html.parser")
+        soup = BeautifulSoup(html, "html.parser")
 
         # Trova tutti gli elementi <script> con type="application/ld+json"
-        json_ld_scripts = soup.find_all("script", type="application/ld+json")
-
-        for script in json_ld_scripts:
-            try:
-                # Carica il contenuto del blocco JSON-LD
-                data = json.loads(script.string)
-                # Se è presente il tipo "Product", lo aggiungiamo alla lista dei graph
-                for item in data.get("@graph", []):
-                    if item.get("@type") == "Product":
-                        json_data["@graph"].append(item)
-                        print(f"Prodotto estratto da {url}")
-            except json.JSONDecodeError:
-                print(f"Errore nel parsing del JSON-LD da {url}")
+        json_ld_scripts = [script.string for script in soup.find_all("script", type="application/ld+json")]
+    elif parser_backend == 'stream':
+        json_ld_scripts = extract_json_ld_scripts(html)
     else:
+        raise ValueError(f"Backend di parsing non supportato: {parser_backend}")
+
+    products = []
+    for script in json_ld_scripts:
+        try:
+            # Carica il contenuto del blocco JSON-LD
+            data = json.loads(script)
+            # Se è presente il tipo "Product", lo aggiungiamo alla lista dei prodotti
+            for item in data.get("@graph", []):
+                if item.get("@type") == "Product":
+                    products.append(item)
+                    print(f"Prodotto estratto da {url}")
+        except json.JSONDecodeError:
+            print(f"Errore nel parsing del JSON-LD da {url}")
+    return products
+
+
+# Calcola l'hash dei prodotti estratti, indipendente dall'ordine delle chiavi
+def hash_products(products):
+    serialized = json.dumps(products, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def fetch_product_json_ld(url, session=None, throttle=None, timeout=30, entry=None, parser_backend='bs4'):
+    """
+    Scarica la pagina all'URL specificato e restituisce la tupla (prodotti, voce del manifest, modificato).
+    Se `entry` contiene ETag/Last-Modified della visita precedente la richiesta è condizionale:
+    con una risposta 304 la pagina non viene né scaricata né analizzata e si riusano i prodotti salvati.
+    """
+    if throttle is not None:
+        throttle.wait(url)
+
+    headers = {}
+    if entry:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    # Effettua la richiesta HTTP all'URL specificato
+    try:
+        response = (session or requests).get(url, headers=headers, timeout=timeout)
+    except requests.exceptions.RequestException as e:
+        print(f"Errore nella richiesta: {e} per {url}")
+        return (entry['products'], entry, False) if entry else ([], None, False)
+
+    # La pagina non è cambiata dall'ultima visita
+    if response.status_code == 304 and entry:
+        print(f"Pagina invariata: {url}")
+        return entry['products'], entry, False
+
+    # Verifica che la richiesta sia andata a buon fine
+    if response.status_code != 200:
         print(f"Errore nella richiesta: {response.status_code} per {url}")
+        return (entry['products'], entry, False) if entry else ([], None, False)
 
+    products = parse_product_json_ld(response.text, url, parser_backend)
+    new_entry = {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'hash': hash_products(products),
+        'products': products
+    }
+    # La pagina è stata riscaricata ma i prodotti estratti possono essere identici
+    changed = entry is None or entry.get('hash') != new_entry['hash']
+    return products, new_entry, changed
 
-def convert_json_ld_to_turtle(json_ld_data, output_file):
-    # Crea un grafo RDF
-    g = Graph()
 
-    # Definisci i prefissi
-    g.bind("schema", "http://schema.org/")
+def extract_product_json_ld(url, session=None):
+    # Aggiunge al grafo globale i prodotti estratti dalla pagina
+    products, _, _ = fetch_product_json_ld(url, session)
+    json_data["@graph"].extend(products)
 
-    # Aggiungi il JSON-LD al grafo
-    g.parse(data=json.dumps(json_ld_data), format="json-ld")
 
-    # Salva il grafo in formato Turtle
-    g.serialize(destination=output_file, format="turtle")
+def convert_json_ld_to_turtle(json_ld_data, output_file, workers=1):
+    # Converte il JSON-LD in Turtle a blocchi di prodotti, senza costruire l'intero grafo in memoria
+    convert_json_ld_to_turtle_stream(json_ld_data, output_file, workers=workers)
     print(f"Salvato il file Turtle in {output_file}")
 
 
-def save_state(index):
-    state_file_path = 'export/state.txt'
-    with open(state_file_path, 'w') as state_file:
-        state_file.write(str(index))
-    print(f"Stato salvato all'indice {index}")
+def convert_pages_to_turtle(fixed_nodes, entries, output_file, workers=1):
+    """
+    Scrive il file Turtle concatenando i nodi fissi e un frammento per permalink: le voci che hanno
+    già il frammento in 'turtle' (prodotti invariati rispetto al manifest) vengono riusate, le altre
+    vengono convertite e il loro frammento viene salvato nella voce, così il costo della conversione
+    dipende solo dalle pagine cambiate.
+    """
+    missing = [entry for entry in entries if entry.get('turtle') is None]
+    context = resolve_context(json_data["@context"])
+    header, *fragments = convert_node_groups(context, [fixed_nodes] + [entry['products'] for entry in missing], workers)
+    for entry, fragment in zip(missing, fragments):
+        entry['turtle'] = fragment if entry['products'] else ''
+
+    tmp_file = output_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write(header)
+        for entry in entries:
+            f.write(entry['turtle'])
+    os.replace(tmp_file, output_file)
+    print(f"Salvato il file Turtle in {output_file} ({len(missing)} pagine convertite, "
+          f"{len(entries) - len(missing)} riusate dal manifest)")
+
+
+def load_manifest():
+    # Il manifest associa a ogni permalink ETag, Last-Modified, hash e prodotti estratti
+    if os.path.exists(MANIFEST_FILE):
+        with open(MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def save_manifest(manifest):
+    # Scrive su un file temporaneo e lo sostituisce, così un crash non corrompe il manifest
+    tmp_file = MANIFEST_FILE + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_file, MANIFEST_FILE)
+    print(f"Manifest salvato in {MANIFEST_FILE} ({len(manifest)} permalink)")
+
+
+def load_store():
+    """
+    Legge lo store append-only della corsa in corso e restituisce un dizionario indice -> record.
+    Una riga finale troncata da un crash viene scartata e rimossa dal file.
+    """
+    records = {}
+    if not os.path.exists(STORE_FILE):
+        return records
+    valid_bytes = 0
+    with open(STORE_FILE, 'rb') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Scartata una riga incompleta in {STORE_FILE}")
+                break
+            if not line.endswith(b'\n'):
+                break
+            records[record['index']] = record
+            valid_bytes += len(line)
+    if valid_bytes != os.path.getsize(STORE_FILE):
+        with open(STORE_FILE, 'r+b') as f:
+            f.truncate(valid_bytes)
+    return records
+
+
+def append_to_store(store, record):
+    # Ogni URL elaborato è una sola riga JSON scritta con un'unica write e sincronizzata su disco
+    store.write(json.dumps(record, ensure_ascii=False) + '\n')
+    store.flush()
+    os.fsync(store.fileno())
+
 
+def process_urls(csv_file, concurrency=8, host_delay=0.2, incremental=False, parser_backend='bs4'):
+    """
+    Processa i permalink del file CSV con un pool di `concurrency` thread che condividono
+    una sessione HTTP; `host_delay` è l'intervallo minimo in secondi tra due richieste
+    verso lo stesso host. Con concurrency=1 e host_delay=0 si ottiene il comportamento sequenziale.
 
-def load_state():
-    state_file_path = 'export/state.txt'
-    if os.path.exists(state_file_path):
-        with open(state_file_path, 'r') as state_file:
-            return int(state_file.read().strip())
-    return 0
+    Con `incremental=True` le richieste sono condizionali e basate sul manifest: le pagine
+    invariate non vengono riscaricate né analizzate e, se nessun prodotto è cambiato,
+    il file Turtle esistente non viene rigenerato. Il manifest conserva anche il frammento
+    Turtle di ogni permalink, per cui vengono riconvertite solo le pagine cambiate.
 
+    `parser_backend` seleziona l'estrattore JSON-LD ('bs4' oppure 'stream', vedi parse_product_json_ld).
 
-def process_urls(csv_file):
+    Ogni URL elaborato viene registrato nello store append-only; dopo un'interruzione la corsa
+    riprende dagli URL mancanti nello store. Il file JSON unificato e il file Turtle vengono
+    scritti una sola volta al termine, dopodiché lo store viene rimosso.
+    """
     # Percorso completo del file CSV
     csv_path = os.path.join('export', csv_file)
 
@@ -94,50 +327,84 @@ def process_urls(csv_file):
         reader = csv.DictReader(file)
         urls = [row['permalink'] for row in reader]
 
-    # Carica lo stato dell'elaborazione
-    start_index = load_state()
-
-    # Si assicura che l'indice di partenza non superi la lunghezza della lista
-    if start_index > len(urls):
-        raise IndexError("L'indice di partenza è maggiore della lunghezza della lista di URL.")
-
     # Definisce la directory di output
     output_dir = 'export'
     os.makedirs(output_dir, exist_ok=True)
 
-    if start_index < len(urls):
-        print(f"Riprendendo da URL numero {start_index + 1}: {urls[start_index]}")
+    # Carica i record della corsa interrotta, ignorando quelli che non corrispondono più al CSV
+    records = {i: record for i, record in load_store().items()
+               if i < len(urls) and record['url'] == urls[i]}
+    pending = [i for i in range(len(urls)) if i not in records]
+
+    manifest = load_manifest()
+
+    if pending:
+        if records:
+            print(f"Riprendendo la corsa: {len(records)} URL già elaborati, {len(pending)} da elaborare")
+
+        session = create_session(pool_size=concurrency)
+        throttle = HostThrottle(host_delay)
 
-        # Itera attraverso tutti gli URL e processa ciascuno, a partire dall'indice specificato
-        for i, url in enumerate(urls[start_index:], start=start_index):
-            extract_product_json_ld(url)
-            # Salva periodicamente i risultati per evitare perdite di dati
-            if (i + 1) % 5 == 0:  # salva ogni 5 URL
-                json_output_file = os.path.join(output_dir, 'all_products.json')
+        def fetch(i):
+            entry = manifest.get(urls[i]) if incremental else None
+            return fetch_product_json_ld(urls[i], session, throttle, entry=entry, parser_backend=parser_backend)
 
-                with open(json_output_file, 'w', encoding='utf-8') as f:
-                    json.dump(json_data, f, ensure_ascii=False, indent=2)
-                print(f"Salvato il file unificato in {json_output_file}")
+        # Scarica le pagine con al più `concurrency` richieste in volo e registra
+        # ciascun risultato nello store insieme alla sua posizione nel CSV
+        with session, ThreadPoolExecutor(max_workers=concurrency) as executor, \
+                open(STORE_FILE, 'a', encoding='utf-8') as store:
+            for i, (_, entry, changed) in zip(pending, executor.map(fetch, pending)):
+                record = {'index': i, 'url': urls[i], 'entry': entry, 'changed': changed}
+                append_to_store(store, record)
+                records[i] = record
 
-                # Salva lo stato dell'elaborazione
-                save_state(i + 1)
+    # Assembla il grafo finale nell'ordine del CSV
+    fixed_nodes = list(json_data["@graph"])
+    for i in range(len(urls)):
+        entry = records[i]['entry']
+        if entry is not None:
+            json_data["@graph"].extend(entry['products'])
 
-    # Prima di convertire in Turtle, legge il file JSON salvato
     json_output_file = os.path.join(output_dir, 'all_products.json')
-    if os.path.exists(json_output_file):
-        with open(json_output_file, 'r', encoding='utf-8') as f:
-            json_data_from_file = json.load(f)
+    tmp_file = json_output_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(json_data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, json_output_file)
+    print(f"Salvato il file unificato in {json_output_file}")
 
-        # Converte il JSON-LD in Turtle e salva
-        turtle_output_file = os.path.join(output_dir, 'all_products.ttl')
-        convert_json_ld_to_turtle(json_data_from_file, turtle_output_file)
-        print(f"Conversione in Turtle completata. Salvato il file in {turtle_output_file}")
+    # Un permalink rimosso dal CSV modifica comunque il grafo finale
+    changed_count = sum(1 for record in records.values() if record['changed'])
+    changed_count += len(set(manifest) - set(urls))
+    print(f"Pagine modificate: {changed_count} su {len(urls)}")
+
+    # Il frammento Turtle della corsa precedente resta valido finché i prodotti hanno lo stesso hash
+    for i in range(len(urls)):
+        entry, previous = records[i]['entry'], manifest.get(urls[i])
+        if (entry is not None and entry.get('turtle') is None and previous
+                and previous.get('hash') == entry['hash'] and previous.get('turtle') is not None):
+            entry['turtle'] = previous['turtle']
+
+    # Aggiorna il manifest con i soli permalink presenti nel CSV
+    manifest = {urls[i]: records[i]['entry'] for i in range(len(urls)) if records[i]['entry'] is not None}
+
+    turtle_output_file = os.path.join(output_dir, 'all_products.ttl')
+    if incremental and changed_count == 0 and os.path.exists(turtle_output_file):
+        print(f"Nessun prodotto modificato. Il file {turtle_output_file} è già aggiornato.")
     else:
-        print(f"Il file {json_output_file} non esiste. Conversione in Turtle non effettuata.")
+        # Converte in Turtle solo le pagine senza frammento valido e concatena i frammenti
+        convert_pages_to_turtle(fixed_nodes, list(manifest.values()), turtle_output_file)
+        print(f"Conversione in Turtle completata. Salvato il file in {turtle_output_file}")
+    save_manifest(manifest)
+
+    # La corsa è completa: la prossima esecuzione ripartirà da uno store vuoto
+    if os.path.exists(STORE_FILE):
+        os.remove(STORE_FILE)
+
 
 if __name__ == '__main__':
     # Nome del file CSV
     csv_file = 'permalinks.csv'
 
-    # Processa tutti gli URL e salva i dati in un unico file JSON e Turtle
+    # Processa tutti gli URL e salva i dati in un unico file JSON e Turtle;
+    # per l'aggiornamento notturno usare process_urls(csv_file, incremental=True)
     process_urls(csv_file)
@@ -0,0 +1,207 @@
+import re
+from decimal import Decimal, InvalidOperation
+
+# Colonne del file Excel usate per arricchire i prodotti
+ENRICHMENT_COLUMNS = ['Capacita', 'Categoria Olfattiva', 'Categorie']
+
+
+def build_enrichment_index(df, columns=ENRICHMENT_COLUMNS):
+    """
+    Costruisce una sola volta un indice colonnare dal DataFrame del file Excel:
+    un dizionario permalink -> posizione di riga e, per ogni colonna presente,
+    una lista di valori Python nativi in cui le celle vuote valgono None.
+    In caso di permalink duplicati prevale l'ultima riga, come nel dizionario costruito con iterrows.
+    """
+    positions = dict(zip(df['permalink'].tolist(), range(len(df))))
+    values = {}
+    for column in columns:
+        if column in df.columns:
+            series = df[column].astype(object)
+            values[column] = series.where(series.notna(), None).tolist()
+    return {'positions': positions, 'values': values}
+
+
+# Restituisce il permalink del prodotto rimuovendo "/#richSnippet" se presente
+def product_permalink(product):
+    link = product.get('@id', '')
+    if link.endswith('/#richSnippet'):
+        return link.rsplit('/#richSnippet', 1)[0]
+    return link
+
+
+def merge_property(product, name, value, stats, indexed=None):
+    """
+    Imposta la PropertyValue `name` del prodotto al valore indicato senza duplicarla:
+    se esiste già viene aggiornata (eliminando eventuali copie lasciate da esecuzioni precedenti),
+    altrimenti viene aggiunta. Un valore uguale a `indexed`, la forma prodotta da
+    normalize_for_indexing, è considerato invariato e non viene riscritto.
+    Aggiorna i contatori 'added', 'replaced' e 'unchanged'.
+    """
+    properties = product.setdefault('additionalProperty', [])
+    same_name = [prop for prop in properties if isinstance(prop, dict) and prop.get('name') == name]
+    if not same_name:
+        properties.append({'@type': 'PropertyValue', 'name': name, 'value': value})
+        stats['added'] += 1
+        return
+
+    first = same_name[0]
+    if len(same_name) == 1 and (first.get('value') == value or first.get('value') == indexed):
+        stats['unchanged'] += 1
+        return
+
+    first['value'] = value
+    # Rimuove le copie con lo stesso nome lasciate dalle esecuzioni in modalità append
+    duplicates = {id(prop) for prop in same_name[1:]}
+    product['additionalProperty'] = [prop for prop in properties if id(prop) not in duplicates]
+    stats['replaced'] += 1
+
+
+def append_property(product, name, value, stats, indexed=None):
+    # Modalità storica: aggiunge sempre una nuova PropertyValue
+    product.setdefault('additionalProperty', []).append({
+        '@type': 'PropertyValue',
+        'name': name,
+        'value': value
+    })
+    stats['added'] += 1
+
+
+def enrich_products(products_graph, index, mode='merge'):
+    """
+    Applica in un solo passaggio le integrazioni del file Excel ai prodotti del @graph:
+    imposta le proprietà Capacita e Gruppo Olfattivo e sostituisce la categoria.
+    Con mode='merge' le proprietà sono unite per nome e il risultato non cambia
+    rieseguendo l'arricchimento; con mode='append' vengono sempre aggiunte.
+    Restituisce i contatori dei prodotti trovati e delle proprietà aggiunte, sostituite e invariate.
+    """
+    if mode == 'merge':
+        set_property = merge_property
+    elif mode == 'append':
+        set_property = append_property
+    else:
+        raise ValueError(f"Modalità di arricchimento non supportata: {mode}")
+
+    positions = index['positions']
+    capacities = index['values'].get('Capacita')
+    olfactory = index['values'].get('Categoria Olfattiva')
+    categories = index['values'].get('Categorie')
+
+    stats = {'matched': 0, 'added': 0, 'replaced': 0, 'unchanged': 0}
+    for product in products_graph:
+        if product.get('@type') != 'Product':
+            continue
+
+        # Controlla se il permalink esiste nel file Excel
+        row = positions.get(product_permalink(product))
+        if row is None:
+            continue
+        stats['matched'] += 1
+
+        # Imposta la capacità se presente nel file Excel
+        if capacities is not None and capacities[row] is not None:
+            set_property(product, 'Capacita', capacities[row], stats)
+
+        # Imposta il gruppo olfattivo, solo se non è una stringa vuota
+        if olfactory is not None and olfactory[row] is not None and olfactory[row]:
+            value = olfactory[row]
+            indexed = indexed_form(split_olfactory_groups(value), value) if isinstance(value, str) else None
+            set_property(product, 'Gruppo Olfattivo', value, stats, indexed)
+
+        # Sostituisce la categoria con quella trovata nel file Excel; la categoria già
+        # normalizzata per l'indicizzazione conta come invariata
+        if categories is not None and categories[row] is not None:
+            value = categories[row]
+            indexed = indexed_form(split_categories(value), value) if isinstance(value, str) else value
+            if product.get('category') in (value, indexed):
+                stats['unchanged'] += 1
+            else:
+                stats['replaced' if 'category' in product else 'added'] += 1
+                product['category'] = value
+
+    return stats
+
+
+def enrich_json_ld(data, df, mode='merge'):
+    # Arricchisce il documento JSON-LD con le informazioni del DataFrame e restituisce i contatori
+    index = build_enrichment_index(df)
+    return enrich_products(data.get('@graph', []), index, mode)
+
+
+# Gruppi olfattivi singoli; l'espressione regolare prova prima i nomi più lunghi
+OLFACTORY_GROUPS = ['Agrumato', 'Ambrato', 'Aromatico', 'Chypre', 'Cuoio', 'Dolce', 'Floreale', 'Fruttato',
+                    'Gourmand', 'Legnoso', 'Muschiato', 'Senza Profumo', 'Speziato Leggero']
+OLFACTORY_PATTERN = re.compile('|'.join(re.escape(group) for group in sorted(OLFACTORY_GROUPS, key=len, reverse=True)))
+# Una parte composta solo da gruppi noti separati da spazi ("Floreale Fruttato")
+OLFACTORY_COMBINATION = re.compile(r'(?:%s)(?:\s+(?:%s))*' % (OLFACTORY_PATTERN.pattern, OLFACTORY_PATTERN.pattern))
+
+XSD_DECIMAL = 'http://www.w3.org/2001/XMLSchema#decimal'
+
+
+# Divide una stringa di categorie ("Fragranze Donna, Fragranze Uomo") nelle singole categorie
+def split_categories(category):
+    parts = [part.strip() for part in re.split(r'[,|>]', category)]
+    return [part for part in parts if part]
+
+
+# Divide un gruppo olfattivo sui separatori e scompone le combinazioni di gruppi noti;
+# le parti non riconosciute ("Orientale") restano come valori a sé, senza perderle
+def split_olfactory_groups(value):
+    groups = []
+    for part in split_categories(value):
+        if OLFACTORY_COMBINATION.fullmatch(part):
+            groups.extend(OLFACTORY_PATTERN.findall(part))
+        else:
+            groups.append(part)
+    return list(dict.fromkeys(groups))
+
+
+# Forma di un valore dopo la normalizzazione: la parte singola, la lista delle parti o,
+# se non ci sono parti, il valore originale
+def indexed_form(parts, value):
+    if not parts:
+        return value
+    return parts[0] if len(parts) == 1 else parts
+
+
+# Converte un prezzo in un letterale xsd:decimal, lasciandolo invariato se non è numerico
+def typed_price(price):
+    if isinstance(price, dict):
+        return price
+    try:
+        value = Decimal(str(price).strip())
+    except InvalidOperation:
+        return price
+    return {'@value': str(value), '@type': XSD_DECIMAL}
+
+
+def normalize_for_indexing(products_graph):
+    """
+    Rende i dati interrogabili con pattern esatti sfruttando gli indici del triple store:
+    ogni categoria e ogni gruppo olfattivo diventano un valore distinto (quindi una tripla
+    ciascuno) e i prezzi delle offerte diventano letterali xsd:decimal. Va eseguita dopo
+    enrich_products e, come quest'ultima, dà lo stesso risultato se ripetuta.
+    Restituisce il numero di prodotti normalizzati.
+    """
+    normalized = 0
+    for product in products_graph:
+        if product.get('@type') != 'Product':
+            continue
+        normalized += 1
+
+        # Una tripla schema:category per ogni categoria
+        category = product.get('category')
+        if isinstance(category, str):
+            product['category'] = indexed_form(split_categories(category), category)
+
+        # Un valore della PropertyValue "Gruppo Olfattivo" per ogni gruppo
+        for prop in product.get('additionalProperty', []):
+            if isinstance(prop, dict) and prop.get('name') == 'Gruppo Olfattivo' and isinstance(prop.get('value'), str):
+                prop['value'] = indexed_form(split_olfactory_groups(prop['value']), prop['value'])
+
+        # Prezzi come letterali decimali tipizzati
+        offers = product.get('offers')
+        for offer in offers if isinstance(offers, list) else [offers]:
+            if isinstance(offer, dict) and 'price' in offer:
+                offer['price'] = typed_price(offer['price'])
+
+    return normalized
@@ -0,0 +1,91 @@
+import copy
+import random
+import time
+import pandas as pd
+from arricchimento import build_enrichment_index, enrich_products
+
+OLFACTORY_GROUPS = ['Agrumato', 'Ambrato', 'Aromatico', 'Chypre', 'Cuoio', 'Dolce', 'Floreale', 'Fruttato',
+                    'Gourmand', 'Legnoso', 'Muschiato', 'Senza Profumo', 'Speziato Leggero']
+
+
+# Genera un catalogo sintetico di n prodotti e il relativo foglio Excel con celle vuote sparse
+def synthetic_catalogue(n, seed=0):
+    rng = random.Random(seed)
+    products = []
+    rows = []
+    for i in range(n):
+        permalink = f"http://www.ethos.local/prodotto/p-{i}"
+        products.append({
+            '@type': 'Product',
+            '@id': f"{permalink}/#richSnippet",
+            'name': f"Prodotto {i}",
+            'category': 'Fragranze'
+        })
+        rows.append({
+            'permalink': permalink,
+            'Capacita': rng.choice([None, '30 ml', '50 ml', '100 ml']),
+            'Categoria Olfattiva': rng.choice([None, ''] + OLFACTORY_GROUPS),
+            'Categorie': rng.choice([None, 'Fragranze Donna', 'Fragranze Uomo'])
+        })
+    return products, pd.DataFrame(rows)
+
+
+# Percorso originale di raffinamento.py: dizionario di Series costruito con iterrows
+def enrich_products_iterrows(products_graph, df):
+    lookup = {row['permalink']: row for index, row in df.iterrows()}
+    for product in products_graph:
+        if product.get('@type') == 'Product':
+            link = product.get('@id', '')
+            if link.endswith('/#richSnippet'):
+                permalink = link.rsplit('/#richSnippet', 1)[0]
+            else:
+                permalink = link
+
+            if permalink in lookup:
+                info = lookup[permalink]
+                if 'Capacita' in info and pd.notna(info['Capacita']):
+                    if 'additionalProperty' not in product:
+                        product['additionalProperty'] = []
+                    product['additionalProperty'].append({
+                        '@type': 'PropertyValue',
+                        'name': 'Capacita',
+                        'value': info['Capacita']
+                    })
+                if 'Categoria Olfattiva' in info and pd.notna(info['Categoria Olfattiva']):
+                    olfactory_categories = info['Categoria Olfattiva']
+                    if olfactory_categories:
+                        if 'additionalProperty' not in product:
+                            product['additionalProperty'] = []
+                        product['additionalProperty'].append({
+                            '@type': 'PropertyValue',
+                            'name': 'Gruppo Olfattivo',
+                            'value': olfactory_categories
+                        })
+                if 'Categorie' in info and pd.notna(info['Categorie']):
+                    product['category'] = info['Categorie']
+
+
+def run_benchmark(n=100000):
+    products, df = synthetic_catalogue(n)
+    print(f"Catalogo sintetico: {n} prodotti")
+
+    products_iterrows = copy.deepcopy(products)
+    start = time.perf_counter()
+    enrich_products_iterrows(products_iterrows, df)
+    time_iterrows = time.perf_counter() - start
+
+    products_index = copy.deepcopy(products)
+    start = time.perf_counter()
+    enrich_products(products_index, build_enrichment_index(df), mode='append')
+    time_index = time.perf_counter() - start
+
+    if products_iterrows != products_index:
+        raise AssertionError("I due percorsi producono prodotti diversi")
+
+    print(f"  iterrows:          {time_iterrows:8.3f} s")
+    print(f"  indice colonnare:  {time_index:8.3f} s")
+    print(f"  speedup:           {time_iterrows / time_index:8.1f}x")
+
+
+if __name__ == '__main__':
+    run_benchmark()
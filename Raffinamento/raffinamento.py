@@ -1,6 +1,7 @@
 import json
 import pandas as pd
 import os
+from arricchimento import build_enrichment_index, enrich_products, normalize_for_indexing
 
 # Percorso al file JSON e al file Excel finale
 base_dir = os.path.abspath(os.path.join('..'))
@@ -8,71 +9,40 @@ json_file = os.path.join(base_dir, 'all_products.json')
 xlsx_file = os.path.join(base_dir, 'informazioni_da_aggiungere_FINALE.xlsx')
 output_json_file = os.path.join(base_dir, 'all_products_FINALE.json')
 
-# Carica il file JSON
-with open(json_file, 'r', encoding='utf-8') as file:
-    data = json.load(file)
 
-# Estrai il campo "@graph"
-products_graph = data.get('@graph', [])
+def raffina(json_file, xlsx_file, output_json_file):
+    # Carica il file JSON
+    with open(json_file, 'r', encoding='utf-8') as file:
+        data = json.load(file)
 
-# Leggi il file Excel
-print(f"Leggendo il file Excel da: {xlsx_file}")
-df = pd.read_excel(xlsx_file)
-print(f"Dati letti dal file Excel:\n{df.head()}")
+    # Estrai il campo "@graph"
+    products_graph = data.get('@graph', [])
 
-# Crea un dizionario per cercare i dati del file Excel
-lookup = {row['permalink']: row for index, row in df.iterrows()}
-print(f"Dizionario di ricerca creato. Contiene {len(lookup)} voci.")
+    # Leggi il file Excel
+    print(f"Leggendo il file Excel da: {xlsx_file}")
+    df = pd.read_excel(xlsx_file)
+    print(f"Dati letti dal file Excel:\n{df.head()}")
 
-# Itera su ogni entità nel campo "@graph" mantenendo tutte le entità
-for product in products_graph:
-    if product.get('@type') == 'Product':
-        # Estrai e modifica il link rimuovendo "/#richSnippet" se presente
-        link = product.get('@id', '')
-        if link.endswith('/#richSnippet'):
-            permalink = link.rsplit('/#richSnippet', 1)[0]
-        else:
-            permalink = link
+    # Crea l'indice colonnare per cercare i dati del file Excel
+    index = build_enrichment_index(df)
+    print(f"Indice di ricerca creato. Contiene {len(index['positions'])} voci.")
 
-        # Controlla se il permalink esiste nel file Excel
-        if permalink in lookup:
-            info = lookup[permalink]
+    # Imposta capacità e gruppo olfattivo e sostituisce la categoria, mantenendo tutte le entità;
+    # le proprietà sono unite per nome, per cui rieseguire il raffinamento non crea duplicati
+    stats = enrich_products(products_graph, index, mode='merge')
+    print(f"Prodotti arricchiti: {stats['matched']}. Proprietà aggiunte: {stats['added']}, "
+          f"sostituite: {stats['replaced']}, invariate: {stats['unchanged']}")
 
-            # Controlla se il campo 'Capacita' è presente e valido
-            if 'Capacita' in info and pd.notna(info['Capacita']):
-                if 'additionalProperty' not in product:
-                    product['additionalProperty'] = []
+    # Una tripla per categoria e per gruppo olfattivo e prezzi decimali, per query a corrispondenza esatta
+    normalize_for_indexing(products_graph)
 
-                # Aggiungi la capacità solo se non è vuota
-                product['additionalProperty'].append({
-                    '@type': 'PropertyValue',
-                    'name': 'Capacita',
-                    'value': info['Capacita']
-                })
-                # print(f"Aggiunto valore di capacità: {info['Capacita']}")
+    # Salva il file JSON aggiornato, mantenendo tutte le entità originali
+    print(f"Salvando il file JSON aggiornato in: {output_json_file}")
+    with open(output_json_file, 'w', encoding='utf-8') as file:
+        json.dump(data, file, indent=4, ensure_ascii=False)
 
-            # Aggiungi gruppo olfattivo dalla colonna "Categoria Olfattiva", solo se non vuota
-            if 'Categoria Olfattiva' in info and pd.notna(info['Categoria Olfattiva']):
-                olfactory_categories = info['Categoria Olfattiva']
-                if olfactory_categories:  # Controlla che non sia una stringa vuota
-                    if 'additionalProperty' not in product:
-                        product['additionalProperty'] = []
+    print("File JSON aggiornato con successo!")
 
-                    product['additionalProperty'].append({
-                        '@type': 'PropertyValue',
-                        'name': 'Gruppo Olfattivo',
-                        'value': olfactory_categories
-                    })
-                    # print(f"Aggiunti gruppi olfattivi: {olfactory_categories}")
 
-            # Sostituisci la categoria con quella trovata nel file Excel, solo se non vuota
-            if 'Categorie' in info and pd.notna(info['Categorie']):
-                product['category'] = info['Categorie']
-                # print(f"Sostituita la categoria con: {info['Categorie']}")
-
-# Salva il file JSON aggiornato, mantenendo tutte le entità originali
-print(f"Salvando il file JSON aggiornato in: {output_json_file}")
-with open(output_json_file, 'w', encoding='utf-8') as file:
-    json.dump(data, file, indent=4, ensure_ascii=False)
-
-print("File JSON aggiornato con successo!")
\ No newline at end of file
+if __name__ == '__main__':
+    raffina(json_file, xlsx_file, output_json_file)
@@ -0,0 +1,117 @@
+import os
+import requests
+from requests.adapters import HTTPAdapter
+from rdflib import Graph, URIRef, BNode
+
+# Oxigraph è opzionale: se non è installato il backend locale usa rdflib
+try:
+    import pyoxigraph
+except ImportError:
+    pyoxigraph = None
+
+# Configurazione predefinita dei backend
+FUSEKI_URL = "http://localhost:3030/ds"
+TTL_FILE = os.path.join('..', 'all_products_FINALE.ttl')
+
+
+class HttpBackend:
+    """
+    Esegue le query su un endpoint SPARQL remoto (Fuseki) con un pool di connessioni persistenti.
+    Restituisce i risultati nel formato JSON dei risultati SPARQL.
+    """
+    max_concurrency = None
+
+    def __init__(self, url=FUSEKI_URL, pool_size=8, timeout=30):
+        self.url = url
+        self.timeout = timeout
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def query(self, sparql_query):
+        try:
+            response = self.session.get(self.url, params={'query': sparql_query, 'format': 'json'},
+                                        timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            print(f"Errore durante l'esecuzione della query: {e}")
+            return None
+
+    def close(self):
+        self.session.close()
+
+
+class LocalBackend:
+    """
+    Carica una sola volta il file Turtle in uno store indicizzato locale e risponde alle query
+    nel processo stesso, senza passare per HTTP né per la codifica JSON. Usa Oxigraph se è
+    installato (su disco se è indicato `store_path`, riusando lo store già caricato), altrimenti
+    un grafo rdflib in memoria. I risultati hanno la stessa struttura di quelli dell'HttpBackend.
+    """
+    # Le query locali sono vincolate alla CPU: eseguirle in parallelo con i thread non aiuta
+    max_concurrency = 1
+
+    def __init__(self, ttl_file=TTL_FILE, store_path=None):
+        if pyoxigraph is not None:
+            self.store = pyoxigraph.Store(store_path) if store_path else pyoxigraph.Store()
+            # Uno store su disco già popolato non viene ricaricato: va cancellato se il Turtle cambia
+            if len(self.store) == 0:
+                self.store.bulk_load(path=ttl_file, format=pyoxigraph.RdfFormat.TURTLE)
+            self.engine = 'oxigraph'
+        else:
+            self.store = Graph()
+            self.store.parse(ttl_file, format='turtle')
+            self.engine = 'rdflib'
+        print(f"Caricato '{ttl_file}' nel backend locale ({self.engine}, {len(self.store)} triple)")
+
+    def query(self, sparql_query):
+        try:
+            if self.engine == 'oxigraph':
+                solutions = self.store.query(sparql_query)
+                variables = [variable.value for variable in solutions.variables]
+                rows = ([solution[variable] for variable in variables] for solution in solutions)
+                to_binding = oxigraph_term_to_binding
+            else:
+                result = self.store.query(sparql_query)
+                variables = [str(variable) for variable in result.vars]
+                rows = (list(row) for row in result)
+                to_binding = rdflib_term_to_binding
+            bindings = []
+            for row in rows:
+                bindings.append({variable: to_binding(term) for variable, term in zip(variables, row)
+                                 if term is not None})
+            return {"head": {"vars": variables}, "results": {"bindings": bindings}}
+        except Exception as e:
+            print(f"Errore durante l'esecuzione della query: {e}")
+            return None
+
+    def close(self):
+        pass
+
+
+# Convertono un termine RDF nel formato di binding dei risultati SPARQL JSON
+def oxigraph_term_to_binding(term):
+    if isinstance(term, pyoxigraph.NamedNode):
+        return {"type": "uri", "value": term.value}
+    if isinstance(term, pyoxigraph.BlankNode):
+        return {"type": "bnode", "value": term.value}
+    return {"type": "literal", "value": term.value}
+
+
+def rdflib_term_to_binding(term):
+    if isinstance(term, URIRef):
+        return {"type": "uri", "value": str(term)}
+    if isinstance(term, BNode):
+        return {"type": "bnode", "value": str(term)}
+    return {"type": "literal", "value": str(term)}
+
+
+# Crea il backend indicato: 'http' per Fuseki oppure 'local' per lo store in-process
+def create_backend(kind='http', **options):
+    if kind == 'http':
+        return HttpBackend(**options)
+    if kind == 'local':
+        return LocalBackend(**options)
+    raise ValueError(f"Backend SPARQL non supportato: {kind}")
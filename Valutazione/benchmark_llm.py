@@ -0,0 +1,104 @@
+import ast
+import asyncio
+import random
+import time
+
+from esecuzione_llm import TokenBucket, invoke_all, invoke_with_retry
+
+VALID_OUTPUT = '[["brand", ""], ["category", "Fragranze Donna"], ["capacity", ""], ["olfactory category", "Floreale"], ["price", "< 30"]]'
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers):
+        self.status_code = status_code
+        self.headers = headers
+
+
+class FakeRateLimitError(Exception):
+    def __init__(self, retry_after):
+        super().__init__("Rate limit exceeded")
+        self.response = FakeResponse(429, {'retry-after': str(retry_after)})
+
+
+class FakeMessage:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeChatModel:
+    """
+    Modello finto con la stessa interfaccia `ainvoke` della chain: simula la latenza, una quota
+    di richieste al secondo oltre la quale risponde 429 con Retry-After, e output non validi.
+    Le query che contengono "illeggibile" non producono mai un output valido.
+    """
+
+    def __init__(self, latency=0.3, quota_per_second=20, invalid_rate=0.1, seed=0):
+        self.latency = latency
+        self.quota_per_second = quota_per_second
+        self.invalid_rate = invalid_rate
+        self.rng = random.Random(seed)
+        self.window = (0, 0)
+        self.calls = 0
+        self.rate_limited = 0
+
+    async def ainvoke(self, inputs):
+        self.calls += 1
+        second = int(time.monotonic())
+        start, count = self.window
+        self.window = (second, count + 1) if start == second else (second, 1)
+        if self.window[1] > self.quota_per_second:
+            self.rate_limited += 1
+            raise FakeRateLimitError(retry_after=1)
+        await asyncio.sleep(self.latency)
+        if 'illeggibile' in inputs['text_query'] or self.rng.random() < self.invalid_rate:
+            return FakeMessage("Ecco i campi richiesti: brand vuoto, categoria Fragranze Donna")
+        return FakeMessage(VALID_OUTPUT)
+
+
+def validate(llm_output):
+    try:
+        output = ast.literal_eval(llm_output)
+    except (ValueError, SyntaxError):
+        return False
+    return isinstance(output, list) and len(output) == 5
+
+
+# Percorso sequenziale: una query alla volta, come nel ciclo originale (ma con tentativi limitati)
+async def invoke_sequential(chain, inputs_list):
+    limiter = TokenBucket(rate=1000, capacity=1)
+    return [await invoke_with_retry(chain, inputs, validate, limiter) for inputs in inputs_list]
+
+
+def run_benchmark(n=100):
+    inputs_list = [{'text_query': f"fragranze donna floreale minori di {i} euro"} for i in range(n)]
+    inputs_list[7] = {'text_query': "query illeggibile"}
+    print(f"Benchmark su {n} query testuali con un modello finto:")
+
+    model = FakeChatModel()
+    start = time.perf_counter()
+    sequential = asyncio.run(invoke_sequential(model, inputs_list))
+    time_sequential = time.perf_counter() - start
+    print(f"  sequenziale:  {time_sequential:7.2f} s, {model.calls} chiamate")
+
+    model = FakeChatModel()
+    outputs, dead_letters, stats = asyncio.run(invoke_all(model, inputs_list, validate, concurrency=16, rate=18))
+    print(f"  concorrente:  {stats['elapsed']:7.2f} s, {stats['calls']} chiamate, "
+          f"{model.rate_limited} risposte 429, {stats['dead_letters']} in dead-letter")
+    print(f"  speedup:      {time_sequential / stats['elapsed']:7.1f}x")
+
+    # Con un rate oltre la quota del provider le risposte 429 rallentano tutte le chiamate
+    model = FakeChatModel()
+    _, rate_limited_dead_letters, rate_limited_stats = asyncio.run(
+        invoke_all(model, inputs_list, validate, concurrency=32, rate=60))
+    print(f"  oltre quota:  {rate_limited_stats['elapsed']:7.2f} s, {rate_limited_stats['calls']} chiamate, "
+          f"{model.rate_limited} risposte 429, {rate_limited_stats['dead_letters']} in dead-letter")
+
+    if any(output is not None and not validate(output) for output, _, _ in sequential) or \
+            any(output is not None and not validate(output) for output in outputs):
+        raise AssertionError("Output non valido accettato")
+    if inputs_list[7] not in [letter['input'] for letter in dead_letters]:
+        raise AssertionError("La query illeggibile non è nella dead-letter list")
+
+
+if __name__ == '__main__':
+    run_benchmark()
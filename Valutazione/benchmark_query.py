@@ -0,0 +1,112 @@
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Annotazione'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Raffinamento'))
+from conversione_turtle import convert_json_ld_to_turtle_stream
+from arricchimento import normalize_for_indexing
+from backend_sparql import LocalBackend
+from costruttore_query import generate_sparql_query
+
+# Contesto in linea, così il benchmark non dipende dalla rete
+CONTEXT = {"@vocab": "http://schema.org/"}
+OLFACTORY_GROUPS = ['Agrumato', 'Ambrato', 'Aromatico', 'Floreale', 'Fruttato', 'Legnoso', 'Muschiato']
+BRANDS = [f"Brand {i}" for i in range(30)]
+
+
+# Genera un catalogo sintetico con categorie e gruppi olfattivi concatenati e prezzi testuali
+def synthetic_graph(n, seed=0):
+    rng = random.Random(seed)
+    graph = []
+    for i in range(n):
+        groups = sorted(rng.sample(OLFACTORY_GROUPS, rng.randint(1, 2)))
+        graph.append({
+            '@type': 'Product',
+            '@id': f"http://www.ethos.local/prodotto/p-{i}/#richSnippet",
+            'name': f"Prodotto {i}",
+            'category': rng.choice(['Fragranze Donna', 'Fragranze Uomo', 'Fragranze Donna, Fragranze Uomo']),
+            'brand': {'@type': 'Brand', 'name': rng.choice(BRANDS)},
+            'offers': {'@type': 'Offer', 'price': f"{rng.uniform(5, 150):.2f}", 'priceCurrency': 'EUR'},
+            'additionalProperty': [
+                {'@type': 'PropertyValue', 'name': 'Capacita', 'value': rng.choice(['30 ml', '50 ml', '100 ml'])},
+                {'@type': 'PropertyValue', 'name': 'Gruppo Olfattivo', 'value': ' '.join(groups)}
+            ]
+        })
+    return graph
+
+
+# Query con CONTAINS e conversione del prezzo a tempo di query, come prima della normalizzazione
+def legacy_sparql_query(query_input):
+    clauses = []
+    if query_input.get('price'):
+        clauses.append('?product schema:offers ?offer .')
+    if query_input.get('category'):
+        clauses.append(f'?product schema:category ?category . FILTER(CONTAINS(?category, "{query_input["category"]}"))')
+    if query_input.get('capacity'):
+        clauses.append(f'?product schema:additionalProperty [ a schema:PropertyValue ; schema:name "Capacita" ; schema:value "{query_input["capacity"]}" ] .')
+    if query_input.get('brand'):
+        clauses.append(f'?product schema:brand [ a schema:Brand ; schema:name "{query_input["brand"]}" ] .')
+    if query_input.get('olfactory_category'):
+        clauses.append(f'?product schema:additionalProperty [ a schema:PropertyValue ; schema:name "Gruppo Olfattivo" ; schema:value ?olfattivo ] . FILTER(CONTAINS(?olfattivo, "{query_input["olfactory_category"]}"))')
+    if query_input.get('price'):
+        clauses.append(f'?offer schema:price ?price ; schema:priceCurrency ?currency . FILTER(xsd:decimal(?price) < {query_input["price"][1:]})')
+    return ('PREFIX schema: <http://schema.org/>\nPREFIX xsd: <http://www.w3.org/2001/XMLSchema#>\n'
+            'SELECT ?product WHERE { ?product a schema:Product ; schema:name ?name . ' + ' '.join(clauses) + ' }')
+
+
+def benchmark_queries():
+    features = {
+        'brand': BRANDS[:3],
+        'category': ['Fragranze Donna', 'Fragranze Uomo'],
+        'capacity': ['50 ml'],
+        'olfactory_category': ['Floreale', 'Legnoso', 'Floreale Fruttato'],
+        'price': ['<30', '<75']
+    }
+    queries = []
+    for n in [2, 3]:
+        for combination in itertools.combinations(features, n):
+            for values in itertools.product(*[features[feature] for feature in combination]):
+                queries.append(dict(zip(combination, values)))
+    return queries
+
+
+def load_backend(graph, directory, name):
+    ttl_file = os.path.join(directory, f"{name}.ttl")
+    convert_json_ld_to_turtle_stream({"@context": CONTEXT, "@graph": graph}, ttl_file, chunk_size=1000, rdf_format='nt')
+    return LocalBackend(ttl_file)
+
+
+def time_queries(backend, queries):
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        bindings = backend.query(query)["results"]["bindings"]
+        results.append({binding["product"]["value"] for binding in bindings})
+    return (time.perf_counter() - start) / len(queries), results
+
+
+def run_benchmark(sizes=(1000, 5000, 20000)):
+    queries = benchmark_queries()
+    print(f"{len(queries)} query per dimensione del catalogo")
+    with tempfile.TemporaryDirectory() as directory:
+        for n in sizes:
+            graph = synthetic_graph(n)
+            before = load_backend(graph, directory, f"before_{n}")
+            normalize_for_indexing(graph)
+            after = load_backend(graph, directory, f"after_{n}")
+
+            time_before, results_before = time_queries(before, [legacy_sparql_query(q) for q in queries])
+            time_after, results_after = time_queries(after, [generate_sparql_query(q) for q in queries])
+            if results_before != results_after:
+                raise AssertionError(f"Risultati diversi prima e dopo la normalizzazione (n={n})")
+
+            print(f"n={n:>6}: CONTAINS {time_before * 1000:8.2f} ms/query, "
+                  f"esatte {time_after * 1000:8.2f} ms/query, speedup {time_before / time_after:5.1f}x")
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,79 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+# File SQLite con i campi estratti dall'LLM per ogni query testuale
+CACHE_FILE = 'cache_llm.sqlite'
+CACHE_MAX_ENTRIES = 50000
+# Durata delle voci in secondi (None: nessuna scadenza)
+CACHE_TTL = None
+
+
+class LLMCache:
+    """
+    Cache persistente delle estrazioni dell'LLM: per ogni query testuale memorizza il dizionario
+    dei campi già validato e capitalizzato. La chiave è l'hash di template del prompt, modello,
+    temperatura e testo della query, quindi cambiare uno di questi invalida le voci. Le voci più
+    vecchie di `ttl` secondi vengono scartate e oltre `max_entries` si eliminano le meno usate.
+    """
+
+    def __init__(self, prompt_template, model_name, temperature, path=CACHE_FILE,
+                 max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL):
+        self.prefix = '\n'.join([hashlib.sha256(prompt_template.encode('utf-8')).hexdigest(),
+                                 model_name, repr(temperature)])
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, fields TEXT NOT NULL, "
+            "created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.evict()
+
+    def key(self, text_query):
+        return hashlib.sha256(f"{self.prefix}\n{text_query}".encode('utf-8')).hexdigest()
+
+    def evict(self):
+        # Elimina le voci scadute e, oltre la dimensione massima, quelle usate meno di recente
+        if self.ttl is not None:
+            self.connection.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        count = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            self.connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,)
+            )
+        self.connection.commit()
+
+    def get_many(self, text_queries):
+        # Restituisce {query testuale: campi} per le query presenti in cache
+        found = {}
+        now = time.time()
+        for text_query in dict.fromkeys(text_queries):
+            key = self.key(text_query)
+            row = self.connection.execute("SELECT fields, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl is not None and row[1] < now - self.ttl):
+                self.misses += 1
+                continue
+            self.hits += 1
+            found[text_query] = json.loads(row[0])
+            self.connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        self.connection.commit()
+        return found
+
+    def put_many(self, extracted):
+        now = time.time()
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO responses (key, fields, created, last_used) VALUES (?, ?, ?, ?)",
+            [(self.key(text_query), json.dumps(fields, ensure_ascii=False), now, now)
+             for text_query, fields in extracted.items()]
+        )
+        self.evict()
+
+    def close(self):
+        print(f"Cache LLM: {self.hits} hit, {self.misses} miss")
+        self.connection.close()
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# File SQLite con i risultati delle query già eseguite
+CACHE_FILE = 'cache_sparql.sqlite'
+CACHE_MAX_ENTRIES = 100000
+# Voci tenute anche in memoria, per servire le query ripetute senza accedere al disco
+MEMORY_ENTRIES = 4096
+
+# Letterali stringa SPARQL, da non toccare durante la normalizzazione
+STRING_LITERAL = re.compile(r'"(?:[^"\\]|\\.)*"')
+
+
+# Normalizza il testo della query comprimendo gli spazi fuori dai letterali,
+# così query che differiscono solo per indentazione condividono la stessa voce
+def normalize_query(query):
+    parts = []
+    last = 0
+    for match in STRING_LITERAL.finditer(query):
+        parts.append(' '.join(query[last:match.start()].split()))
+        parts.append(match.group())
+        last = match.end()
+    parts.append(' '.join(query[last:].split()))
+    return ' '.join(part for part in parts if part)
+
+
+# Impronta del dataset: la versione indicata esplicitamente oppure l'hash del file Turtle caricato
+# (nel backend locale o in Fuseki); None se il file non esiste e non si può distinguere un dataset
+# ricaricato da quello precedente
+def dataset_fingerprint(ttl_file, version=None):
+    if version is not None:
+        return f"version:{version}"
+    if not os.path.exists(ttl_file):
+        return None
+    digest = hashlib.sha256()
+    with open(ttl_file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Cache persistente dei risultati SPARQL, con chiave hash(query normalizzata + impronta del dataset):
+    se il file Turtle cambia, le voci precedenti non vengono più usate. Oltre `max_entries` voci
+    vengono eliminate quelle usate meno di recente (LRU). Le voci più recenti restano anche in
+    un LRU in memoria; gli accessi vengono registrati su disco alla scrittura successiva o alla chiusura.
+    Conta hit e miss.
+    """
+
+    def __init__(self, fingerprint, path=CACHE_FILE, max_entries=CACHE_MAX_ENTRIES, memory_entries=MEMORY_ENTRIES):
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        self.touched = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, result TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self.connection.commit()
+
+    def key(self, query):
+        text = f"{self.fingerprint}\n{normalize_query(query)}"
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def remember(self, key, result):
+        self.memory[key] = result
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def flush_touched(self):
+        if self.touched:
+            self.connection.executemany("UPDATE results SET last_used = ? WHERE key = ?",
+                                        [(last_used, key) for key, last_used in self.touched.items()])
+            self.touched.clear()
+
+    def get(self, query):
+        key = self.key(query)
+        with self.lock:
+            if key in self.memory:
+                result = self.memory[key]
+                self.memory.move_to_end(key)
+            else:
+                row = self.connection.execute("SELECT result FROM results WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                result = json.loads(row[0])
+                self.remember(key, result)
+            self.hits += 1
+            self.touched[key] = time.time()
+        return result
+
+    def put(self, query, result):
+        key = self.key(query)
+        with self.lock:
+            self.remember(key, result)
+            self.touched.pop(key, None)
+            self.flush_touched()
+            self.connection.execute("INSERT OR REPLACE INTO results (key, result, last_used) VALUES (?, ?, ?)",
+                                    (key, json.dumps(result), time.time()))
+            # Eliminazione LRU delle voci in eccesso
+            count = self.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            if count > self.max_entries:
+                self.connection.execute(
+                    "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self.connection.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0}
+
+    def close(self):
+        with self.lock:
+            self.flush_touched()
+            self.connection.commit()
+        self.connection.close()
+
+
+class CachedBackend:
+    """
+    Avvolge un backend SPARQL (vedi backend_sparql.py) servendo dalla cache le query già eseguite.
+    I risultati nulli (errori) non vengono memorizzati.
+    """
+
+    def __init__(self, backend, cache):
+        self.backend = backend
+        self.cache = cache
+        self.max_concurrency = backend.max_concurrency
+
+    def query(self, sparql_query):
+        result = self.cache.get(sparql_query)
+        if result is None:
+            result = self.backend.query(sparql_query)
+            if result is not None:
+                self.cache.put(sparql_query, result)
+        return result
+
+    def close(self):
+        stats = self.cache.stats()
+        print(f"Cache risultati SPARQL: {stats['hits']} hit, {stats['misses']} miss "
+              f"(hit rate {stats['hit_rate']:.1%})")
+        self.cache.close()
+        self.backend.close()
+
+
+# Avvolge il backend con la cache dei risultati solo se il dataset ha un'impronta: senza file Turtle
+# né versione esplicita le voci resterebbero valide anche dopo aver ricaricato Fuseki
+def cached_backend(backend, ttl_file, version=None, path=CACHE_FILE):
+    fingerprint = dataset_fingerprint(ttl_file, version)
+    if fingerprint is None:
+        print(f"Attenzione: '{ttl_file}' non trovato e nessuna versione del dataset indicata, "
+              f"cache dei risultati SPARQL disattivata")
+        return backend
+    return CachedBackend(backend, ResultCache(fingerprint, path))
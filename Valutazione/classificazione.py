@@ -2,29 +2,49 @@ import pandas as pd
 import ast
 import pickle
 from tqdm import tqdm
-from bs4 import BeautifulSoup
 from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, PromptTemplate
 import re
 import json
 import itertools
+from runner_classificazione import classify_products, classify_products_batched, estimate_tokens, migrate_pickle
+from riparazione_output import is_canonical, repair_classification, response_format
+from pulizia_html import clean_descriptions
+from deduplicazione import group_descriptions
+from tabelle import save_table
+
+# Se True esporta anche le descrizioni pulite in Excel come report
+EXCEL_REPORT = False
+
+# Richieste in volo e richieste al secondo verso il provider durante la classificazione
+CONCURRENCY = 8
+REQUESTS_PER_SECOND = 0.5
+
+# Modalità batch: più descrizioni per richiesta, con K scelto in base al budget di token
+# e al contesto del modello (8192 token per llama3-groq-70b-8192)
+BATCHED = True
+TOKEN_BUDGET = 6000
+CONTEXT_LIMIT = 8192
+
+# Vincolo sull'output dei batch: 'json_object' (JSON mode), 'json_schema' per i modelli che
+# supportano gli schemi, None per nessun vincolo
+OUTPUT_CONSTRAINT = 'json_object'
+
+# Deduplicazione delle descrizioni delle varianti: 'exact' (testo normalizzato identico),
+# 'minhash' (anche quasi identiche) oppure None per classificare ogni prodotto
+DEDUP_MODE = 'exact'
+
+# Tentativi della correzione con l'LLM, usata solo per gli output non riparabili localmente
+MAX_TENTATIVI_CORREZIONE = 5
 
 # Carica il file Excel in un DataFrame
 df = pd.read_excel('../all_products.xlsx', sheet_name='all_products', engine='openpyxl')
 
-# Funzione per rimuovere i tag HTML
-def remove_html_tags(html_content):
-    if isinstance(html_content, str):
-        soup = BeautifulSoup(html_content, 'html.parser')
-        return soup.get_text(separator=' ').strip()
-    return html_content
-
-# Applica la funzione alla colonna delle descrizioni
-df['post_content'] = df['post_content'].apply(remove_html_tags)
+# Pulisce le descrizioni (tag HTML, entity e spazi), riusando la cache delle esecuzioni precedenti
+df['post_content'] = clean_descriptions(df['post_content'])
 
-# Salva il DataFrame modificato in un nuovo file Excel
-df.to_excel('../prodotti_puliti.xlsx', index=False, engine='openpyxl')
-print("Descrizioni pulite salvate in 'prodotti_puliti.xlsx'")
+# Salva il DataFrame modificato (e, se richiesto, il report Excel)
+save_table(df, 'prodotti_puliti.parquet', excel_report='../prodotti_puliti.xlsx' if EXCEL_REPORT else None)
 
 # Definizione del sistema di classificazione
 system = '''
@@ -60,7 +80,8 @@ Sei un frontend developer e stai lavorando a un e-commerce. Il tuo compito è cl
 </output>
 '''
 
-chat = ChatGroq(temperature=0.5, model_name="llama3-groq-70b-8192-tool-use-preview", groq_api_key='example_api_key')
+chat = ChatGroq(temperature=0.5, model_name="llama3-groq-70b-8192-tool-use-preview", groq_api_key='example_api_key',
+                max_retries=0)
 
 prompt = ChatPromptTemplate(
     input_variables=['descrizione'],
@@ -73,44 +94,66 @@ prompt = ChatPromptTemplate(
 
 chain = prompt | chat
 
-# CATEGORIZZATORE
-with open("cat.pickle", "rb") as file:
-    cat = pickle.load(file)
+# Prompt della modalità batch: le descrizioni arrivano come array JSON e la risposta è un array JSON per ID
+system_batch = '''
+<variabile>
+{prodotti}
+</variabile>
 
-start = len(cat)
+<contesto>
+Sei un frontend developer e stai lavorando a un e-commerce. Il tuo compito è classificare i prodotti in modo dicotomico (0-1). La variabile contiene un array JSON di prodotti, ognuno con "id" e "descrizione". Classifica ogni prodotto in base alla sua descrizione nelle seguenti categorie: Agrumato, Ambrato, Aromatico, Chypre, Cuoio, Dolce, Floreale, Fruttato, Gourmand, Legnoso, Muschiato, Senza Profumo, Speziato Leggero.
+</contesto>
 
-for i in tqdm(range(2801, len(df['post_content']))):
-    description = df['post_content'][i]
-    success = False
-    t = 0
-    while not success:
-        try:
-            testo = chain.invoke(description)
-            testo = testo.content
-            cat.append(testo)
-            success = True
-        except Exception as e:
-            error_message = str(e)
-            if 'context_length_exceeded' in error_message:
-                description = description[:300]
-                print(f"Context length exceeded per i={i}. Ridotto a 300 caratteri.")
-                t = 0
-            elif 'internal_server_error' in error_message:
-                print(f"Errore del server interno per i={i}. Riprovando con lo stesso testo.")
-                time.sleep(1)
-            else:
-                print(f"Errore generale (i={i}, tentativo={t+1}): {e}")
-                t += 1
-                if t >= 10:
-                    print(f"Numero massimo di tentativi raggiunto per i={i}. Aggiungo valore di fallback.")
-                    cat.append([["Agrumato", 0], ["Ambrato", 0], ["Aromatico", 0], ["Chypre", 0], ["Cuoio", 0], ["Dolce", 0], ["Floreale", 0], ["Fruttato", 0], ["Gourmand", 0], ["Legnoso", 0], ["Muschiato", 0], ["Senza Profumo", 0], ["Speziato Leggero", 0]])
-                    success = True
-                else:
-                    time.sleep(1)
+<istruzioni>
+1. Leggi la descrizione di ogni prodotto.
+2. Per ogni categoria assegna un punteggio 0 oppure 1 in base alla presenza o assenza di elementi caratteristici.
+3. Restituisci solo un oggetto JSON con la chiave "prodotti" e un oggetto per ogni prodotto, con lo stesso "id", come indicato nel tag <output>.
+</istruzioni>
+
+<output>
+{{"prodotti": [ {{"id": id, "Agrumato": punteggio, "Ambrato": punteggio, "Aromatico": punteggio, "Chypre": punteggio, "Cuoio": punteggio, "Dolce": punteggio, "Floreale": punteggio, "Fruttato": punteggio, "Gourmand": punteggio, "Legnoso": punteggio, "Muschiato": punteggio, "Senza Profumo": punteggio, "Speziato Leggero": punteggio}} ]}}
+</output>
+'''
+
+prompt_batch = ChatPromptTemplate(
+    input_variables=['prodotti'],
+    messages=[
+        HumanMessagePromptTemplate(
+            prompt=PromptTemplate(input_variables=['prodotti'], template=system_batch)
+        )
+    ]
+)
+
+batch_format = response_format(OUTPUT_CONSTRAINT)
+batch_chain = prompt_batch | (chat.bind(response_format=batch_format) if batch_format else chat)
+
+# CATEGORIZZATORE
+# Le classificazioni vengono salvate per ID in uno store append-only: a ogni esecuzione si
+# riprende dai prodotti mancanti (lo stato del vecchio cat.pickle viene importato la prima volta)
+product_ids = df['ID'].tolist()
+migrate_pickle("cat.pickle", product_ids)
+
+# Le varianti con la stessa descrizione vengono classificate una volta sola, tramite un rappresentante
+descriptions = df['post_content'].tolist()
+representatives = group_descriptions(descriptions, DEDUP_MODE) if DEDUP_MODE else list(range(len(descriptions)))
+unique = sorted(set(representatives))
+print(f"{len(unique)} descrizioni distinte su {len(descriptions)} prodotti: "
+      f"{len(descriptions) - len(unique)} classificazioni con l'LLM risparmiate")
+unique_ids = [product_ids[position] for position in unique]
+unique_descriptions = [descriptions[position] for position in unique]
+
+if BATCHED:
+    classificazioni = classify_products_batched(batch_chain, unique_ids, unique_descriptions,
+                                                prompt_tokens=estimate_tokens(system_batch), concurrency=CONCURRENCY,
+                                                rate=REQUESTS_PER_SECOND, token_budget=TOKEN_BUDGET,
+                                                context_limit=CONTEXT_LIMIT)
+else:
+    classificazioni = classify_products(chain, unique_ids, unique_descriptions,
+                                        concurrency=CONCURRENCY, rate=REQUESTS_PER_SECOND)
 
 # CORREGGE FORMATTAZIONE
-with open("cat_serializzato.pickle", "rb") as file:
-    cat = pickle.load(file)
+# Ogni prodotto riceve la classificazione del rappresentante del suo gruppo
+cat = [classificazioni[product_ids[representative]] for representative in representatives]
 
 system_formattazione = '''
 <variabile>
@@ -141,35 +184,25 @@ prompt_formattazione = ChatPromptTemplate(
     ]
 )
 
-llm_chain = LLMChain(llm=chat, prompt=prompt_formattazione)
+llm_chain = prompt_formattazione | chat
 
 def correggi_formattazione(elemento, index):
     tentativi = 0
-    while tentativi < 100:
+    while tentativi < MAX_TENTATIVI_CORREZIONE:
         try:
-            testo_corretto = llm_chain.run({"lista": elemento})
-            corretto = ast.literal_eval(testo_corretto.strip())
-            if isinstance(corretto, list) and all(
-                isinstance(elem, list) and len(elem) == 2 and isinstance(elem[0], str) and isinstance(elem[1], int)
-                for elem in corretto
-            ):
-                return testo_corretto
+            testo_corretto = llm_chain.invoke({"lista": elemento}).content
+            corretto = repair_classification(testo_corretto)
+            if corretto is not None:
+                return corretto
         except Exception as e:
             print(f"Errore durante la correzione della formattazione per l'indice {index}: {e}")
         tentativi += 1
 
     return str([["Agrumato", 0], ["Ambrato", 0], ["Aromatico", 0], ["Chypre", 0], ["Cuoio", 0], ["Dolce", 0], ["Floreale", 0], ["Fruttato", 0], ["Gourmand", 0], ["Legnoso", 0], ["Muschiato", 0], ["Senza Profumo", 0], ["Speziato Leggero", 0]])
 
+# Un output è ben formato solo se ha le 13 categorie nell'ordine previsto con flag 0/1
 def verifica_formattazione(elemento):
-    try:
-        lista = ast.literal_eval(elemento)
-        if isinstance(lista, list) and all(
-            isinstance(item, list) and len(item) == 2 and isinstance(item[0], str) and isinstance(item[1], int)
-        ):
-            return True
-    except (SyntaxError, ValueError):
-        return False
-    return False
+    return is_canonical(elemento)
 
 elementi_malfatti = []
 for idx, i in enumerate(tqdm(cat)):
@@ -179,11 +212,20 @@ for idx, i in enumerate(tqdm(cat)):
 with open("elementi_malfatti_serializzato.pickle", "wb") as file:
     pickle.dump(elementi_malfatti, file)
 
+# Gli elementi malformati vengono prima riparati localmente; solo quelli non riparabili
+# passano alla correzione con l'LLM
 if elementi_malfatti:
+    riparati = 0
     for idx in tqdm(elementi_malfatti):
-        cat[idx] = correggi_formattazione(cat[idx], idx)
-        with open("cat_serializzato.pickle", "wb") as file:
-            pickle.dump(cat, file)
+        riparato = repair_classification(cat[idx])
+        if riparato is not None:
+            cat[idx] = riparato
+            riparati += 1
+        else:
+            cat[idx] = correggi_formattazione(cat[idx], idx)
+    print(f"{riparati} elementi malformati su {len(elementi_malfatti)} riparati senza chiamare l'LLM")
+    with open("cat_serializzato.pickle", "wb") as file:
+        pickle.dump(cat, file)
 
 print("Tutti gli elementi malformati sono stati corretti con successo!")
 
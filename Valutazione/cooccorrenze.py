@@ -0,0 +1,28 @@
+import itertools
+import numpy as np
+import pandas as pd
+
+
+def cooccurrence_columns(df, groups, size=2):
+    """
+    Calcola in un'unica operazione vettoriale le colonne di co-occorrenza di tutte le
+    combinazioni (in ordine alfabetico) di `size` gruppi olfattivi: una colonna vale 1
+    se il prodotto appartiene a tutti i gruppi della combinazione. I flag dei gruppi sono
+    rappresentati come matrice booleana prodotti x gruppi, quindi funziona per coppie,
+    triple e per qualunque lista di gruppi.
+    """
+    groups = sorted(groups)
+    combinations = list(itertools.combinations(groups, size))
+    flags = df[groups].to_numpy() == 1
+
+    # Matrice combinazioni x size con gli indici delle colonne dei gruppi da combinare
+    positions = np.array([[groups.index(group) for group in combo] for combo in combinations], dtype=np.intp)
+    values = flags[:, positions].all(axis=2) if combinations else np.zeros((len(df), 0), dtype=bool)
+
+    names = [' '.join(combo) for combo in combinations]
+    return pd.DataFrame(values.astype(np.int64), columns=names, index=df.index)
+
+
+def top_combinations(df_combined, k=10):
+    # Seleziona le k combinazioni con più occorrenze (a parità di conteggio vale l'ordine delle colonne)
+    return df_combined.sum().nlargest(k).index.tolist()
@@ -1,9 +1,19 @@
 import pandas as pd
 import re
 import json
-import itertools
 import os
-from rdflib import Graph
+import sys
+
+# Il convertitore JSON-LD -> Turtle e l'arricchimento sono condivisi con le fasi di Annotazione e Raffinamento
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Annotazione'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Raffinamento'))
+from conversione_turtle import convert_json_ld_to_turtle_stream
+from arricchimento import build_enrichment_index, enrich_products, normalize_for_indexing
+from tabelle import CORPUS_FILE, save_table, load_table
+from cooccorrenze import cooccurrence_columns, top_combinations
+
+# Se True esporta anche la tabella finale in Excel come report
+EXCEL_REPORT = False
 
 
 # Funzione per estrarre capacità in millilitri usando espressioni regolari
@@ -14,13 +24,6 @@ def extract_capacity(title):
     return None
 
 
-# Funzione per creare combinazioni alfabetiche di due gruppi olfattivi
-def create_combined_olfactory_group(row, group1, group2):
-    if row[group1] == 1 and row[group2] == 1:
-        return 1
-    return 0
-
-
 # 1. Carica il file Excel con le descrizioni classificate
 df = pd.read_excel('prodotti_classificati_finale.xlsx')
 
@@ -31,7 +34,7 @@ df['Capacita'] = df['post_title'].apply(extract_capacity)
 df.insert(5, 'Capacita', df.pop('Capacita'))
 
 # Salva il DataFrame temporaneo con le capacità
-df.to_excel('prodotti_con_capacità.xlsx', index=False)
+save_table(df, 'prodotti_con_capacità.parquet')
 
 # 3. Carica e processa il file JSON per estrarre brand, prezzo e link
 json_file = "../all_products.json"
@@ -57,38 +60,28 @@ for product in products_graph:
             'brand': brand
         })
 
-# Crea un DataFrame con i dati estratti e salvalo
-df_prezzi_brand = pd.DataFrame(products_data)
-df_prezzi_brand.to_excel('prodotti_prezzi_brand.xlsx', index=False)
+# Crea un DataFrame con i dati estratti, con il prezzo come colonna numerica, e salvalo
+df_prezzi_brand = pd.DataFrame(products_data, columns=['link', 'prezzo', 'brand'])
+df_prezzi_brand['prezzo'] = pd.to_numeric(df_prezzi_brand['prezzo'], errors='coerce')
+save_table(df_prezzi_brand, 'prodotti_prezzi_brand.parquet')
 
-# 4. Unisce i file 'prodotti_con_capacità.xlsx' e 'prodotti_prezzi_brand.xlsx'
-df_capacità = pd.read_excel('prodotti_con_capacità.xlsx')
+# 4. Unisce i file 'prodotti_con_capacità.parquet' e 'prodotti_prezzi_brand.parquet'
+df_capacità = load_table('prodotti_con_capacità.parquet')
 df_merged = pd.merge(df_capacità, df_prezzi_brand, left_on='permalink', right_on='link', how='left')
 
 # Salva il DataFrame unito
-df_merged.to_excel('prodotti_completi.xlsx', index=False)
+save_table(df_merged, 'prodotti_completi.parquet')
 
 # 5. Crea le combinazioni di gruppi olfattivi
 olfactory_groups = ['Agrumato', 'Ambrato', 'Aromatico', 'Chypre', 'Cuoio', 'Dolce',
                     'Floreale', 'Fruttato', 'Gourmand', 'Legnoso', 'Muschiato',
                     'Senza Profumo', 'Speziato Leggero']
 
-combinations = list(itertools.combinations(sorted(olfactory_groups), 2))
-
-# Crea un nuovo DataFrame per le combinazioni olfattive
-df_combined = pd.DataFrame()
-
-# Aggiunge una colonna per ogni combinazione di gruppi olfattivi
-for combo in combinations:
-    new_column = f"{combo[0]} {combo[1]}"
-    df_combined[new_column] = df_merged.apply(lambda row: create_combined_olfactory_group(row, combo[0], combo[1]),
-                                              axis=1)
-
-# Calcola il numero di occorrenze per ciascuna combinazione
-combined_olfactory_counts = df_combined.sum()
+# Crea in un'unica operazione vettoriale una colonna per ogni coppia di gruppi olfattivi
+df_combined = cooccurrence_columns(df_merged, olfactory_groups, size=2)
 
 # Seleziona le top 10 combinazioni per numero di occorrenze
-top_10_combined_groups = combined_olfactory_counts.nlargest(10).index.tolist()
+top_10_combined_groups = top_combinations(df_combined, 10)
 
 # Mantiene solo le colonne corrispondenti alle top 10 combinazioni
 df_top_10_combined = df_combined[top_10_combined_groups]
@@ -96,15 +89,14 @@ df_top_10_combined = df_combined[top_10_combined_groups]
 # Aggiunge le top 10 combinazioni al DataFrame originale
 df_final = pd.concat([df_merged, df_top_10_combined], axis=1)
 
-# 6. Esporta il risultato finale in un nuovo file Excel
-df_final.to_excel('prodotti_finale.xlsx', index=False)
+# 6. Esporta il risultato finale in Parquet (e, se richiesto, in Excel come report)
+save_table(df_final, CORPUS_FILE, excel_report='prodotti_finale.xlsx' if EXCEL_REPORT else None)
 
-print("File 'prodotti_finale.xlsx' creato con successo!")
+print(f"File '{CORPUS_FILE}' creato con successo!")
 
-# 7. Aggiornamento del file JSON con le nuove informazioni dal file Excel
+# 7. Aggiornamento del file JSON con le nuove informazioni della tabella finale
 base_dir = os.path.abspath(os.path.join('..'))
 json_file = os.path.join(base_dir, 'all_products.json')
-xlsx_file = os.path.join(base_dir, 'prodotti_finale.xlsx')
 output_json_file = os.path.join(base_dir, 'all_products_FINALE.json')
 
 # Carica il file JSON
@@ -114,51 +106,16 @@ with open(json_file, 'r', encoding='utf-8') as file:
 # Estrae il campo "@graph"
 products_graph = data.get('@graph', [])
 
-# Legge il file Excel con le nuove informazioni
-df = pd.read_excel(xlsx_file)
+# Usa direttamente la tabella finale già in memoria invece di rileggerla da Excel
+df = df_final
 
-# Crea un dizionario per cercare i dati del file Excel
-lookup = {row['permalink']: row for index, row in df.iterrows()}
+# Imposta capacità e gruppo olfattivo e sostituisce la categoria in un solo passaggio,
+# unendo le proprietà per nome così che rieseguire lo step non crei duplicati
+stats = enrich_products(products_graph, build_enrichment_index(df), mode='merge')
+print(f"Proprietà aggiunte: {stats['added']}, sostituite: {stats['replaced']}, invariate: {stats['unchanged']}")
 
-# Itera su ogni entità nel campo "@graph" mantenendo tutte le entità
-for product in products_graph:
-    if product.get('@type') == 'Product':
-        # Estrae e modifica il link rimuovendo "/#richSnippet" se presente
-        link = product.get('@id', '')
-        if link.endswith('/#richSnippet'):
-            permalink = link.rsplit('/#richSnippet', 1)[0]
-        else:
-            permalink = link
-
-        # Controlla se il permalink esiste nel file Excel
-        if permalink in lookup:
-            info = lookup[permalink]
-
-            # Aggiunge la capacità se presente nel file Excel
-            if 'Capacita' in info and pd.notna(info['Capacita']):
-                if 'additionalProperty' not in product:
-                    product['additionalProperty'] = []
-                product['additionalProperty'].append({
-                    '@type': 'PropertyValue',
-                    'name': 'Capacita',
-                    'value': info['Capacita']
-                })
-
-            # Aggiunge il gruppo olfattivo se presente nel file Excel
-            if 'Categoria Olfattiva' in info and pd.notna(info['Categoria Olfattiva']):
-                olfactory_categories = info['Categoria Olfattiva']
-                if olfactory_categories:
-                    if 'additionalProperty' not in product:
-                        product['additionalProperty'] = []
-                    product['additionalProperty'].append({
-                        '@type': 'PropertyValue',
-                        'name': 'Gruppo Olfattivo',
-                        'value': olfactory_categories
-                    })
-
-            # Sostituisce la categoria con quella trovata nel file Excel
-            if 'Categorie' in info and pd.notna(info['Categorie']):
-                product['category'] = info['Categorie']
+# Una tripla per categoria e per gruppo olfattivo e prezzi decimali, per query a corrispondenza esatta
+normalize_for_indexing(products_graph)
 
 # Salva il file JSON aggiornato
 with open(output_json_file, 'w', encoding='utf-8') as file:
@@ -168,15 +125,9 @@ print(f"File JSON aggiornato creato con successo: {output_json_file}")
 
 
 # 8. Conversione del file JSON-LD in formato Turtle
-def convert_json_ld_to_turtle(json_data, output_turtle_file):
-    # Crea un grafo RDF
-    g = Graph()
-
-    # Parla il JSON-LD nel grafo RDF
-    g.parse(data=json.dumps(json_data), format='json-ld')
-
-    # Serializza il grafo in formato Turtle e salva
-    g.serialize(destination=output_turtle_file, format='turtle')
+def convert_json_ld_to_turtle(json_data, output_turtle_file, workers=1):
+    # Converte il JSON-LD a blocchi di prodotti e scrive il Turtle in modo incrementale
+    convert_json_ld_to_turtle_stream(json_data, output_turtle_file, workers=workers)
 
 
 # File di input e output per la conversione
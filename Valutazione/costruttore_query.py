@@ -0,0 +1,161 @@
+import os
+import re
+import sys
+from functools import lru_cache
+
+# I gruppi olfattivi sono definiti una sola volta in Raffinamento, dove vengono normalizzati i dati
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Raffinamento'))
+from arricchimento import split_olfactory_groups
+
+# Feature supportate, nell'ordine in cui compaiono le clausole nella query,
+# con la variabile SPARQL a cui viene legato il valore nel blocco VALUES.
+# La categoria olfattiva diventa una feature numerata per ogni gruppo (olfactory_category_1 ... _N),
+# scomposta come in fase di indicizzazione, con variabili ?olfactoryValue1 ... ?olfactoryValueN
+FEATURE_VARIABLES = {
+    'category': 'categoryValue',
+    'capacity': 'capacityValue',
+    'brand': 'brandName',
+    'olfactory_category': 'olfactoryValue',
+    'price': 'maxPrice'
+}
+OLFACTORY_PREFIX = 'olfactory_category_'
+
+# Clausole parametriche a corrispondenza esatta: i dati normalizzati in fase di raffinamento
+# hanno una tripla per categoria e per gruppo olfattivo e prezzi xsd:decimal, per cui non
+# servono CONTAINS né conversioni di tipo a tempo di query
+FEATURE_CLAUSES = {
+    'category': '?product schema:category ?categoryValue .',
+    'capacity': '?product schema:additionalProperty [ a schema:PropertyValue ; schema:name "Capacita" ; schema:value ?capacityValue ] .',
+    'brand': '?product schema:brand [ a schema:Brand ; schema:name ?brandName ] .',
+    'olfactory_category': '?product schema:additionalProperty [ a schema:PropertyValue ; schema:name "Gruppo Olfattivo" ; schema:value ?{variable} ] .',
+    'price': '?offer schema:price ?price ;\n             schema:priceCurrency ?currency .\n      FILTER(?price < ?maxPrice)'
+}
+
+# Segnaposto sostituito con il blocco VALUES di ogni query
+VALUES_PLACEHOLDER = '#VALUES#'
+
+
+# Scompone una categoria olfattiva nei valori indicizzati ("Floreale Fruttato" -> Floreale, Fruttato),
+# con la stessa funzione usata per i dati, così ogni valore cercato corrisponde a una tripla
+def split_olfactory_category(value):
+    return split_olfactory_groups(value) or [value]
+
+
+# Normalizza i nomi delle feature (llm_sparql.py usa "olfactory category" con lo spazio)
+# e scompone la categoria olfattiva nelle feature numerate, una per gruppo
+def normalize_query_input(query_input):
+    normalized = {}
+    for feature, value in query_input.items():
+        feature = feature.replace(' ', '_')
+        if feature == 'olfactory_category' and value:
+            for number, group in enumerate(split_olfactory_category(value), 1):
+                normalized[f'{OLFACTORY_PREFIX}{number}'] = group
+        elif feature in FEATURE_VARIABLES and value:
+            normalized[feature] = value
+    return normalized
+
+
+# Restituisce la forma della query: le feature presenti, nell'ordine canonico,
+# con le feature olfattive numerate al posto di olfactory_category
+def query_shape(query_input):
+    shape = []
+    for feature in FEATURE_VARIABLES:
+        if feature == 'olfactory_category':
+            number = 1
+            while f'{OLFACTORY_PREFIX}{number}' in query_input:
+                shape.append(f'{OLFACTORY_PREFIX}{number}')
+                number += 1
+        elif feature in query_input:
+            shape.append(feature)
+    return tuple(shape)
+
+
+# Variabile SPARQL di una feature (olfactory_category_2 -> olfactoryValue2)
+def feature_variable(feature):
+    if feature.startswith(OLFACTORY_PREFIX):
+        return FEATURE_VARIABLES['olfactory_category'] + feature[len(OLFACTORY_PREFIX):]
+    return FEATURE_VARIABLES[feature]
+
+
+# Clausola di una feature, con le feature olfattive legate alla propria variabile
+def feature_clause(feature):
+    if feature.startswith(OLFACTORY_PREFIX):
+        return FEATURE_CLAUSES['olfactory_category'].format(variable=feature_variable(feature))
+    return FEATURE_CLAUSES[feature]
+
+
+@lru_cache(maxsize=None)
+def compile_template(shape):
+    """
+    Compila una sola volta il testo della query per una forma (insieme di feature).
+    Il testo contiene solo variabili: i valori vengono legati dal blocco VALUES,
+    che sta all'inizio del gruppo WHERE così da essere visibile anche al FILTER sul prezzo.
+    """
+    offer_clause = "?product schema:offers ?offer ." if 'price' in shape else ""
+    clauses = '\n      '.join(feature_clause(feature) for feature in shape)
+    return f"""PREFIX schema: <http://schema.org/>
+    PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+
+    SELECT ?product
+    WHERE {{
+      {VALUES_PLACEHOLDER}
+      ?product a schema:Product ;
+               schema:name ?name .
+      {offer_clause}
+      {clauses}
+    }}"""
+
+
+# Converte un valore in un letterale SPARQL sicuro
+def escape_literal(feature, value):
+    if feature == 'price':
+        # Il prezzo massimo arriva come "<30" o "< 30": deve essere un numero
+        max_price = str(value).replace('<', '').strip()
+        if not re.fullmatch(r'\d+(\.\d+)?', max_price):
+            raise ValueError(f"Prezzo massimo non valido: {value}")
+        return max_price
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"')
+               .replace('\n', '\\n').replace('\r', '\\r'))
+    return f'"{escaped}"'
+
+
+@lru_cache(maxsize=4096)
+def render_query(shape, values):
+    # Lega i valori della combinazione al template della sua forma
+    template = compile_template(shape)
+    if not shape:
+        return template.replace(VALUES_PLACEHOLDER, '')
+    variables = ' '.join(f'?{feature_variable(feature)}' for feature in shape)
+    literals = ' '.join(escape_literal(feature, value) for feature, value in zip(shape, values))
+    return template.replace(VALUES_PLACEHOLDER, f'VALUES ({variables}) {{ ({literals}) }}')
+
+
+def generate_sparql_query(query_input):
+    """
+    Restituisce la query SPARQL per un dizionario di feature (brand, category, capacity,
+    olfactory_category, price). Il template di ogni forma e il testo di ogni combinazione
+    di valori vengono messi in cache e riusati.
+    """
+    query_input = normalize_query_input(query_input)
+    shape = query_shape(query_input)
+    return render_query(shape, tuple(query_input[feature] for feature in shape))
+
+
+def generate_batch_query(query_inputs):
+    """
+    Restituisce una sola query SPARQL che risponde a più combinazioni con la stessa forma:
+    ogni combinazione è una riga del blocco VALUES, identificata da ?qid (la sua posizione
+    nella lista), e la query restituisce le coppie (?qid, ?product).
+    """
+    query_inputs = [normalize_query_input(query_input) for query_input in query_inputs]
+    shape = query_shape(query_inputs[0])
+    if any(query_shape(query_input) != shape for query_input in query_inputs):
+        raise ValueError("Le combinazioni di un batch devono avere la stessa forma")
+
+    variables = ' '.join(['?qid'] + [f'?{feature_variable(feature)}' for feature in shape])
+    rows = ' '.join(
+        '(' + ' '.join([str(qid)] + [escape_literal(feature, query_input[feature]) for feature in shape]) + ')'
+        for qid, query_input in enumerate(query_inputs)
+    )
+    template = compile_template(shape).replace('SELECT ?product', 'SELECT ?qid ?product', 1)
+    return template.replace(VALUES_PLACEHOLDER, f'VALUES ({variables}) {{ {rows} }}')
@@ -0,0 +1,100 @@
+import hashlib
+import re
+import zlib
+
+import numpy as np
+
+# Parametri della modalità MinHash/LSH per le descrizioni quasi identiche
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+ROWS_PER_BAND = 4
+SIMILARITY_THRESHOLD = 0.9
+MERSENNE_PRIME = (1 << 31) - 1
+
+# Capacità ("50 ml", "100ml") e punteggiatura, che distinguono le varianti dello stesso profumo
+CAPACITY_PATTERN = re.compile(r'\d+(?:[.,]\d+)?\s*ml\b', re.IGNORECASE)
+PUNCTUATION_PATTERN = re.compile(r'[^\w\s]')
+
+
+# Normalizza una descrizione per il confronto: minuscole, senza capacità, punteggiatura e spazi ripetuti
+def normalize_text(text):
+    if not isinstance(text, str):
+        return ''
+    text = CAPACITY_PATTERN.sub(' ', text.lower())
+    return ' '.join(PUNCTUATION_PATTERN.sub(' ', text).split())
+
+
+# Shingle di `size` parole consecutive di un testo normalizzato
+def shingles(text, size=SHINGLE_SIZE):
+    words = text.split()
+    if len(words) <= size:
+        return {' '.join(words)}
+    return {' '.join(words[start:start + size]) for start in range(len(words) - size + 1)}
+
+
+# Firme MinHash (testi x permutazioni) calcolate con funzioni hash (a * x + b) mod p
+def minhash_signatures(texts, num_perm=NUM_PERM, seed=0):
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+    b = rng.integers(0, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint64)
+    for position, text in enumerate(texts):
+        hashes = np.array([zlib.crc32(shingle.encode('utf-8')) for shingle in shingles(text)], dtype=np.uint64)
+        signatures[position] = ((hashes[:, None] * a + b) % MERSENNE_PRIME).min(axis=0)
+    return signatures
+
+
+# Restituisce la radice del gruppo di `position` (union-find con compressione dei cammini)
+def find(parents, position):
+    while parents[position] != position:
+        parents[position] = parents[parents[position]]
+        position = parents[position]
+    return position
+
+
+def near_duplicate_groups(texts, threshold=SIMILARITY_THRESHOLD, num_perm=NUM_PERM, rows_per_band=ROWS_PER_BAND):
+    """
+    Raggruppa i testi quasi identici con MinHash e LSH a bande: i testi che condividono una banda
+    vengono confrontati con il primo testo del bucket e uniti se la somiglianza di Jaccard stimata
+    supera `threshold`. Restituisce per ogni testo la posizione del rappresentante del gruppo.
+    """
+    signatures = minhash_signatures(texts, num_perm)
+    parents = list(range(len(texts)))
+    for start in range(0, num_perm, rows_per_band):
+        buckets = {}
+        for position, band in enumerate(signatures[:, start:start + rows_per_band]):
+            buckets.setdefault(band.tobytes(), []).append(position)
+        for members in buckets.values():
+            first = members[0]
+            for position in members[1:]:
+                if (signatures[first] == signatures[position]).mean() >= threshold:
+                    parents[find(parents, position)] = find(parents, first)
+    roots = [find(parents, position) for position in range(len(texts))]
+    # Il rappresentante è il primo elemento di ogni gruppo
+    representatives = {}
+    for position, root in enumerate(roots):
+        representatives.setdefault(root, position)
+    return [representatives[root] for root in roots]
+
+
+def group_descriptions(descriptions, mode='exact', threshold=SIMILARITY_THRESHOLD):
+    """
+    Restituisce per ogni descrizione la posizione del suo rappresentante: con mode='exact' sono
+    raggruppate le descrizioni con lo stesso hash del testo normalizzato, con mode='minhash'
+    vengono uniti anche i gruppi con descrizioni quasi identiche.
+    """
+    normalized = [normalize_text(description) for description in descriptions]
+    first_by_hash = {}
+    representatives = []
+    for position, text in enumerate(normalized):
+        text_hash = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        representatives.append(first_by_hash.setdefault(text_hash, position))
+
+    if mode == 'minhash':
+        unique = sorted(set(representatives))
+        merged = near_duplicate_groups([normalized[position] for position in unique], threshold)
+        unique_representative = {position: unique[merged[index]] for index, position in enumerate(unique)}
+        representatives = [unique_representative[representative] for representative in representatives]
+    elif mode != 'exact':
+        raise ValueError(f"Modalità di deduplicazione non supportata: {mode}")
+    return representatives
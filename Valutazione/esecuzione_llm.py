@@ -0,0 +1,132 @@
+import asyncio
+import time
+from email.utils import parsedate_to_datetime
+
+# Parametri predefiniti dello scheduler delle chiamate all'LLM
+CONCURRENCY = 4
+REQUESTS_PER_SECOND = 0.5
+MAX_ATTEMPTS = 3
+MAX_RATE_LIMITED = 10
+DEFAULT_RETRY_AFTER = 10
+
+
+class TokenBucket:
+    """
+    Rate limiter a token bucket condiviso da tutte le chiamate: concede `rate` richieste al secondo
+    con raffiche di al più `capacity` richieste. Dopo una risposta 429 `block` sospende tutte le
+    chiamate per il tempo indicato dal provider.
+    """
+
+    def __init__(self, rate=REQUESTS_PER_SECOND, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def block(self, seconds):
+        # Il bucket riparte vuoto alla fine del blocco: il periodo bloccato non conta come ricarica,
+        # altrimenti allo sblocco partirebbe subito una raffica di `capacity` richieste
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+        self.updated = self.blocked_until
+
+
+# Restituisce i secondi di attesa se l'errore è un 429 (dall'header Retry-After, in secondi
+# o come data HTTP), altrimenti None
+def rate_limit_delay(error, default=DEFAULT_RETRY_AFTER):
+    response = getattr(error, 'response', None)
+    status = getattr(error, 'status_code', None) or getattr(response, 'status_code', None)
+    if status != 429:
+        return None
+    retry_after = (getattr(response, 'headers', None) or {}).get('retry-after')
+    if retry_after is None:
+        return default
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+async def invoke_with_retry(chain, inputs, validate, limiter, max_attempts=MAX_ATTEMPTS,
+                            max_rate_limited=MAX_RATE_LIMITED):
+    """
+    Invoca la chain finché l'output non supera `validate`, con al più `max_attempts` tentativi.
+    Le risposte 429 non consumano tentativi (fino a `max_rate_limited`) ma bloccano il limiter.
+    Restituisce (output valido o None, tentativi, ultimo output o errore).
+    """
+    attempts = 0
+    rate_limited = 0
+    last = None
+    while attempts < max_attempts:
+        await limiter.acquire()
+        try:
+            result = await chain.ainvoke(inputs)
+        except Exception as e:
+            delay = rate_limit_delay(e)
+            if delay is not None and rate_limited < max_rate_limited:
+                rate_limited += 1
+                limiter.block(delay)
+                continue
+            attempts += 1
+            last = f"{type(e).__name__}: {e}"
+            continue
+        attempts += 1
+        last = result.content
+        if validate(last):
+            return last, attempts, None
+    return None, attempts, last
+
+
+async def invoke_all(chain, inputs_list, validate, concurrency=CONCURRENCY, rate=REQUESTS_PER_SECOND,
+                     max_attempts=MAX_ATTEMPTS):
+    """
+    Esegue la chain su tutti gli input con al più `concurrency` chiamate in volo e `rate` richieste
+    al secondo. Restituisce gli output validi nell'ordine degli input (None per quelli falliti),
+    la dead-letter list degli input che non hanno mai prodotto un output valido e le statistiche.
+    """
+    limiter = TokenBucket(rate, capacity=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(inputs):
+        async with semaphore:
+            return await invoke_with_retry(chain, inputs, validate, limiter, max_attempts)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(run(inputs) for inputs in inputs_list))
+    elapsed = time.perf_counter() - start
+
+    outputs = [output for output, _, _ in results]
+    dead_letters = [{'input': inputs, 'attempts': attempts, 'last_output': last}
+                    for inputs, (output, attempts, last) in zip(inputs_list, results) if output is None]
+    stats = {
+        'inputs': len(inputs_list),
+        'calls': sum(attempts for _, attempts, _ in results),
+        'dead_letters': len(dead_letters),
+        'elapsed': elapsed
+    }
+    return outputs, dead_letters, stats
+
+
+# Versione sincrona di invoke_all, per gli script
+def run_all(chain, inputs_list, validate, **options):
+    return asyncio.run(invoke_all(chain, inputs_list, validate, **options))
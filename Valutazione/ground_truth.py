@@ -1,15 +1,15 @@
-import pandas as pd
 import numpy as np
 import itertools
 import os
 import json
+from tabelle import CORPUS_FILE, load_table
 
 # Crea la cartella "query_combinazioni" se non esiste
 if not os.path.exists('query_combinazioni'):
     os.makedirs('query_combinazioni')
 
-# Carica il file Excel contenente la tabella dei prodotti
-df = pd.read_excel('prodotti_finale.xlsx')
+# Carica la tabella dei prodotti prodotta da corpus.py
+df = load_table(CORPUS_FILE)
 print("[DEBUG] Tabella dei prodotti caricata.")
 
 
@@ -39,38 +39,44 @@ print(
     f"[DEBUG] Caratteristiche disponibili: {len(brands)} brand, {len(categories)} categorie, {len(top_capacities)} capacità, {len(olfactory_categories)} categorie olfattive, {len(price_limits)} classi di prezzo.")
 
 
-# Funzione per filtrare i risultati per ogni combinazione
-def filter_results(df, combination):
-    results = df.copy()
-    print(f"[DEBUG] Filtrando risultati per combinazione: {combination}")
-
-    for feature, value in combination.items():
-        if feature == 'brand':
-            results = results[results['brand'] == value]
-        elif feature == 'category':
-            results = results[results['Categorie'].str.contains(value)]
-        elif feature == 'capacity':
-            results = results[results['Capacita'] == value]
-        elif feature == 'olfactory_category':
-            results = results[
-                results[value] == 1]  # Usa il valore della categoria olfattiva per filtrare la colonna appropriata
-        elif feature == 'price':
-            results = results[results['prezzo'] < int(value[1:])]
-
-    count_results = len(results)
-    print(f"[DEBUG] Risultati filtrati: {count_results} risultati trovati.")
-    return results if count_results >= 20 else None
+# Funzione per calcolare la maschera booleana (bitmap) dei prodotti che soddisfano una singola feature
+def feature_mask(df, feature, value):
+    if feature == 'brand':
+        return (df['brand'] == value).to_numpy()
+    elif feature == 'category':
+        return df['Categorie'].str.contains(value, na=False).to_numpy(dtype=bool)
+    elif feature == 'capacity':
+        return (df['Capacita'] == value).to_numpy()
+    elif feature == 'olfactory_category':
+        # Usa il valore della categoria olfattiva per filtrare la colonna appropriata
+        return (df[value] == 1).to_numpy()
+    elif feature == 'price':
+        return (df['prezzo'] < int(value[1:])).to_numpy()
+    raise ValueError(f"Feature non supportata: {feature}")
+
+
+# Funzione per precalcolare una sola volta le posting list (bitmap) di ogni valore di ogni feature
+def build_posting_lists(df, feature_values):
+    posting_lists = {}
+    for feature, values in feature_values.items():
+        posting_lists[feature] = [(value, feature_mask(df, feature, value)) for value in values]
+    print(f"[DEBUG] Posting list create per {sum(len(v) for v in feature_values.values())} valori di feature.")
+    return posting_lists
+
+
+feature_values = {
+    'brand': brands,
+    'category': categories,
+    'capacity': top_capacities,
+    'olfactory_category': olfactory_categories,
+    'price': price_limits
+}
+posting_lists = build_posting_lists(df, feature_values)
+ids = df['ID'].to_numpy()
 
 
 # Funzione per generare tutte le combinazioni di n feature
 def generate_combinations(n):
-    feature_values = {
-        'brand': brands,
-        'category': categories,
-        'capacity': top_capacities,
-        'olfactory_category': olfactory_categories,
-        'price': price_limits
-    }
 
     # Ottiene tutte le combinazioni di n feature tra quelle disponibili
     feature_keys = list(feature_values.keys())
@@ -79,20 +85,24 @@ def generate_combinations(n):
 
     valid_queries = []
 
+    # Visita in profondità i valori delle feature nello stesso ordine di itertools.product,
+    # intersecando le bitmap e scartando i rami con meno di min_results prodotti
+    def visit(feature_combination, depth, query, mask):
+        if depth == len(feature_combination):
+            valid_queries.append({'query': dict(query), 'results': ids[mask].tolist()})
+            return
+        feature = feature_combination[depth]
+        for value, feature_bitmap in posting_lists[feature]:
+            partial = feature_bitmap if mask is None else mask & feature_bitmap
+            if np.count_nonzero(partial) < min_results:
+                continue
+            query.append((feature, value))
+            visit(feature_combination, depth + 1, query, partial)
+            query.pop()
+
     for feature_combination in feature_combinations:
         print(f"[DEBUG] Elaborazione combinazione: {feature_combination}")
-
-        # Genera tutte le combinazioni dei valori delle feature selezionate
-        value_combinations = list(itertools.product(*[feature_values[feature] for feature in feature_combination]))
-
-        for value_combination in value_combinations:
-            query = dict(zip(feature_combination, value_combination))
-            print(f"[DEBUG] Filtrando risultati per la query: {query}")
-
-            results = filter_results(df, query)
-
-            if results is not None:
-                valid_queries.append({'query': query, 'results': results['ID'].tolist()})
+        visit(feature_combination, 0, [], None)
 
     print(f"[DEBUG] Trovate {len(valid_queries)} combinazioni valide.")
     return valid_queries
@@ -0,0 +1,81 @@
+import os
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from tabelle import CORPUS_FILE, load_table
+
+# Cartella con l'indice permalink <-> ID in formato binario NumPy
+INDEX_DIR = 'indice_prodotti'
+
+# Suffisso dei nodi JSON-LD dei prodotti, da rimuovere per ottenere il permalink
+RICH_SNIPPET_SUFFIX = '/#richSnippet'
+
+
+class ProductIndex:
+    """
+    Indice dell'identità dei prodotti: permalink e ID del corpus, letti dai file .npy mappati
+    in memoria. Le tabelle hash per la mappatura URI -> ID e per quella inversa vengono
+    costruite una sola volta e interrogate su interi result set.
+    """
+
+    def __init__(self, permalinks, ids):
+        self.permalinks = permalinks
+        self.ids = ids
+        self.permalink_positions = pd.Index(permalinks)
+        # Per la mappatura inversa, a parità di ID vale l'ultimo permalink
+        unique_ids = ~pd.Index(ids).duplicated(keep='last')
+        self.id_rows = np.flatnonzero(unique_ids)
+        self.id_positions = pd.Index(ids[unique_ids])
+
+    def __len__(self):
+        return len(self.permalinks)
+
+    def lookup(self, uris):
+        # Restituisce gli ID degli URI presenti nel corpus (gli altri vengono scartati)
+        positions = self.permalink_positions.get_indexer(uris)
+        return self.ids[positions[positions >= 0]]
+
+    def permalinks_for(self, ids):
+        # Mappatura inversa ID -> permalink (gli ID sconosciuti vengono scartati)
+        positions = self.id_positions.get_indexer(ids)
+        return self.permalinks[self.id_rows[positions[positions >= 0]]]
+
+
+# Costruisce l'indice dalla tabella del corpus e lo salva in `index_dir`
+def build_index(table_file=CORPUS_FILE, index_dir=INDEX_DIR):
+    df = load_table(table_file, columns=['permalink', 'ID']).dropna()
+    # A parità di permalink vale l'ultima riga, come nel dizionario usato in precedenza
+    df = df.drop_duplicates('permalink', keep='last')
+    permalinks = df['permalink'].to_numpy(dtype=str)
+    ids = df['ID'].to_numpy(dtype=np.int64)
+
+    os.makedirs(index_dir, exist_ok=True)
+    for name, array in (('permalinks', permalinks), ('ids', ids)):
+        np.save(os.path.join(index_dir, f'{name}.npy'), array)
+    print(f"Indice dei prodotti salvato in '{index_dir}' ({len(permalinks)} prodotti)")
+
+
+@lru_cache(maxsize=None)
+def load_index(table_file=CORPUS_FILE, index_dir=INDEX_DIR):
+    """
+    Restituisce l'indice dei prodotti, caricato una sola volta per processo. L'indice viene
+    ricostruito se manca o se la tabella del corpus è più recente dei file salvati.
+    """
+    stamp = os.path.join(index_dir, 'permalinks.npy')
+    if not os.path.exists(stamp) or os.path.getmtime(stamp) < os.path.getmtime(table_file):
+        build_index(table_file, index_dir)
+    arrays = [np.load(os.path.join(index_dir, f'{name}.npy'), mmap_mode='r')
+              for name in ('permalinks', 'ids')]
+    return ProductIndex(*arrays)
+
+
+# Estrae i permalink dei prodotti dai risultati SPARQL, su tutto il result set in un colpo solo
+def extract_uris(sparql_results, variable='product'):
+    bindings = sparql_results.get("results", {}).get("bindings", []) if sparql_results else []
+    return np.array([binding[variable]["value"].replace(RICH_SNIPPET_SUFFIX, '')
+                     for binding in bindings if variable in binding], dtype=str)
+
+
+# Mappa gli URI agli ID del corpus e li restituisce ordinati
+def map_uris_to_ids(uris, index):
+    return np.sort(index.lookup(uris)).tolist()
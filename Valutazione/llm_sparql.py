@@ -3,11 +3,25 @@ import json
 import re
 import ast
 from langchain_groq import ChatGroq
-import requests
-import pandas as pd
+from indice_prodotti import load_index, extract_uris, map_uris_to_ids
+from backend_sparql import create_backend, TTL_FILE
+from cache_risultati import cached_backend
+from costruttore_query import generate_sparql_query
+from esecuzione_llm import run_all
+from cache_llm import LLMCache
+from parser_regole import build_matcher
 
 # Configurazione del ChatGroq
-chat = ChatGroq(temperature=0.5, model_name="llama3-groq-70b-8192-tool-use-preview", groq_api_key='example-api-key')
+LLM_MODEL = "llama3-groq-70b-8192-tool-use-preview"
+LLM_TEMPERATURE = 0.5
+chat = ChatGroq(temperature=LLM_TEMPERATURE, model_name=LLM_MODEL, groq_api_key='example-api-key',
+                max_retries=0)
+
+# Scheduler delle chiamate: query in volo, richieste al secondo e tentativi per ogni query.
+# I ritentativi del client sono disattivati: i 429 vengono gestiti dal rate limiter condiviso
+LLM_CONCURRENCY = 4
+LLM_REQUESTS_PER_SECOND = 0.5
+LLM_MAX_ATTEMPTS = 3
 
 # Definizione del prompt
 system = '''
@@ -63,6 +77,18 @@ prompt = ChatPromptTemplate(
 
 chain = prompt | chat
 
+# Cache persistente dei campi estratti: 'readwrite' usa e aggiorna la cache, 'replay' usa solo
+# la cache senza chiamare l'LLM (le query mancanti vanno nella dead-letter list), 'off' la disattiva
+LLM_CACHE_MODE = 'readwrite'
+llm_cache = LLMCache(system, LLM_MODEL, LLM_TEMPERATURE) if LLM_CACHE_MODE != 'off' else None
+
+# Le query composte solo da valori noti del corpus vengono interpretate dal matcher a regole,
+# senza chiamare l'LLM; i valori restituiti sono già nella forma canonica del corpus
+RULE_PARSER = True
+matcher = build_matcher() if RULE_PARSER else None
+# Numero di query interpretate da ciascun percorso: regole, cache, llm, scartate
+parser_paths = {'regole': 0, 'cache': 0, 'llm': 0, 'scartate': 0}
+
 
 def validate_output_format(llm_output):
     print("Validazione output...")
@@ -119,110 +145,26 @@ def capitalize_fields(llm_output):
     return capitalized_output
 
 
-def generate_sparql_query(query_input):
-    category_clause = generate_category_clause(query_input.get("category"))
-    capacity_clause = generate_capacity_clause(query_input.get("capacity"))
-    brand_clause = generate_brand_clause(query_input.get("brand"))
-    olfactory_category_clause = generate_olfactory_category_clause(query_input.get("olfactory category"))
-    price_clause = generate_price_clause(query_input.get("price"))
-
-    if query_input.get("price"):
-        offer_clause = "?product schema:offers ?offer ."
-    else:
-        offer_clause = ""
-
-    sparql_query = f"""
-    PREFIX schema: <http://schema.org/>
-    PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
-
-    SELECT ?product
-    WHERE {{
-      ?product a schema:Product ;
-               schema:name ?name .
-      {offer_clause}
-      {category_clause}
-      {capacity_clause}
-      {brand_clause}
-      {olfactory_category_clause}
-      {price_clause}
-    }}
-    """
-    return sparql_query.strip()
-
-
-def generate_category_clause(category):
-    if category:
-        return f' ?product schema:category ?category . FILTER(CONTAINS(?category, "{category}")) '
-    return ""
-
-
-def generate_capacity_clause(capacity):
-    if capacity:
-        return f' ?product schema:additionalProperty [ a schema:PropertyValue ; schema:name "Capacita" ; schema:value "{capacity}" ] . '
-    return ""
-
-
-def generate_brand_clause(brand):
-    if brand:
-        return f' ?product schema:brand [ a schema:Brand ; schema:name "{brand}" ] . '
-    return ""
-
+# Backend SPARQL: 'http' interroga il server Fuseki locale, 'local' carica il file Turtle in-process
+SPARQL_BACKEND = 'http'
+backend = create_backend(SPARQL_BACKEND)
 
-def generate_olfactory_category_clause(olfactory_category):
-    if olfactory_category:
-        return f' ?product schema:additionalProperty [ a schema:PropertyValue ; schema:name "Gruppo Olfattivo" ; schema:value ?olfattivo ] . FILTER(CONTAINS(?olfattivo, "{olfactory_category}")) '
-    return ""
-
-
-def generate_price_clause(price):
-    if price:
-        max_price = price.replace("<", "").strip()
-        return f'''
-        ?offer schema:price ?price ;
-               schema:priceCurrency ?currency .
-        FILTER(xsd:decimal(?price) < {max_price})
-        '''
-    return ""
-
-
-# URL del server Fuseki locale
-FUSEKI_URL = "http://localhost:3030/ds"
-EXCEL_FILE = 'prodotti_finale.xlsx'
+# Cache persistente dei risultati (condivisa con sparql_queries.py): molte estrazioni dell'LLM
+# producono la stessa query, che viene eseguita una sola volta per versione del dataset
+# (l'hash del file Turtle, oppure DATASET_VERSION se il file non è disponibile)
+RESULT_CACHE = True
+DATASET_VERSION = None
+if RESULT_CACHE:
+    backend = cached_backend(backend, TTL_FILE, DATASET_VERSION)
 
 
 def execute_sparql_query(query):
-    """Esegue una query SPARQL sul server Fuseki e restituisce i risultati."""
-    try:
-        response = requests.get(FUSEKI_URL, params={'query': query, 'format': 'json'})
-        response.raise_for_status()  # Assicurati che la richiesta abbia avuto successo
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Errore durante l'esecuzione della query: {e}")
-        return None
-
-
-def extract_uris(sparql_results):
-    """Estrae una lista di URI dai risultati SPARQL."""
-    uris = []
-    if sparql_results and "results" in sparql_results and "bindings" in sparql_results["results"]:
-        for binding in sparql_results["results"]["bindings"]:
-            if "product" in binding and "value" in binding["product"]:
-                uri = binding["product"]["value"].replace('/#richSnippet', '')
-                uris.append(uri)
-    return uris
+    """Esegue una query SPARQL sul backend configurato e restituisce i risultati."""
+    return backend.query(query)
 
 
-def load_excel_mapping(excel_file):
-    """Carica il file Excel e restituisce un dizionario di mappatura URI -> ID."""
-    df = pd.read_excel(excel_file)
-    mapping = dict(zip(df['permalink'], df['ID']))
-    return mapping
-
-
-def map_uris_to_ids(uris, mapping):
-    """Mappa gli URI agli ID usando il dizionario di mappatura."""
-    ids = [mapping.get(uri, None) for uri in uris]
-    return sorted(id for id in ids if id is not None)
+# Indice permalink -> ID del corpus, caricato una sola volta per tutte le query
+product_index = load_index()
 
 
 # Carica e processa i file JSON nella cartella
@@ -236,23 +178,60 @@ for filename in os.listdir(json_folder):
         # Crea una nuova lista per i risultati aggiornati
         updated_data = []
 
-        # Itera attraverso ogni oggetto nel JSON
-        for query_obj in data:
-            text_query = query_obj.get("text_query", "")
+        # Le query testuali vengono interpretate prima dal matcher a regole, poi dalla cache;
+        # le altre (una volta sola anche se ripetute) vengono interpretate dall'LLM in parallelo,
+        # con un numero limitato di tentativi: quelle che non producono mai un output valido
+        # finiscono nella dead-letter list
+        text_queries = [query_obj.get("text_query", "") for query_obj in data]
+        paths = {}
+        extracted = {}
+        if matcher:
+            for text_query in dict.fromkeys(text_queries):
+                fields = matcher.parse(text_query)
+                if fields is not None:
+                    extracted[text_query] = {field[0]: field[1] for field in fields}
+                    paths[text_query] = 'regole'
+        if llm_cache:
+            cached = llm_cache.get_many(text_query for text_query in text_queries if text_query not in extracted)
+            extracted.update(cached)
+            paths.update(dict.fromkeys(cached, 'cache'))
+        missing = [text_query for text_query in dict.fromkeys(text_queries) if text_query not in extracted]
+        print(f"{len(text_queries) - len(missing)} query su {len(text_queries)} risolte senza chiamare l'LLM")
+
+        if LLM_CACHE_MODE == 'replay':
+            dead_letters = [{'input': {"text_query": text_query}, 'attempts': 0, 'last_output': None}
+                            for text_query in missing]
+        elif missing:
+            llm_outputs, dead_letters, stats = run_all(chain, [{"text_query": text_query} for text_query in missing],
+                                                       validate_output_format, concurrency=LLM_CONCURRENCY,
+                                                       rate=LLM_REQUESTS_PER_SECOND, max_attempts=LLM_MAX_ATTEMPTS)
+            print(f"{stats['inputs']} query interpretate con {stats['calls']} chiamate in {stats['elapsed']:.1f} s, "
+                  f"{stats['dead_letters']} senza output valido")
+
+            new_fields = {}
+            for text_query, llm_output in zip(missing, llm_outputs):
+                if llm_output is not None:
+                    print(f"Output generato dalla LLM: {llm_output}")
+                    extracted_fields = capitalize_fields(ast.literal_eval(llm_output))
+                    new_fields[text_query] = {field[0]: field[1] for field in extracted_fields}
+            if llm_cache:
+                llm_cache.put_many(new_fields)
+            extracted.update(new_fields)
+            paths.update(dict.fromkeys(new_fields, 'llm'))
+        else:
+            dead_letters = []
 
+        # Itera attraverso ogni oggetto nel JSON
+        for query_obj, text_query in zip(data, text_queries):
             print(f"\nProcessando la query: {text_query}")
-            valid_output = False
-            while not valid_output:
-                result = chain.invoke({"text_query": text_query})
-                llm_output = result.content  # Estrai il contenuto della LLM
-                print(f"Output generato dalla LLM: {llm_output}")
-
-                valid_output = validate_output_format(llm_output)
-                if not valid_output:
-                    print(f"L'output generato non è valido. Rigenerazione...")
-
-            extracted_fields = capitalize_fields(ast.literal_eval(llm_output))
-            extracted_dict = {field[0]: field[1] for field in extracted_fields}
+            extracted_dict = extracted.get(text_query)
+            query_obj["llm_parser"] = paths.get(text_query, 'scartate')
+            parser_paths[query_obj["llm_parser"]] += 1
+            if extracted_dict is None:
+                query_obj["llm_sparql"] = None
+                query_obj["llm_results"] = []
+                updated_data.append(query_obj)
+                continue
             print(f"Campi estratti: {extracted_dict}")
 
             sparql_query = generate_sparql_query(extracted_dict)
@@ -264,11 +243,8 @@ for filename in os.listdir(json_folder):
             # Estrae URI dai risultati SPARQL
             uri_list = extract_uris(llm_sparql_results) if llm_sparql_results else []
 
-            # Carica la mappatura URI -> ID dal file Excel
-            uri_to_id_mapping = load_excel_mapping(EXCEL_FILE)
-
             # Mappa gli URI agli ID e ordina gli ID
-            id_list = map_uris_to_ids(uri_list, uri_to_id_mapping)
+            id_list = map_uris_to_ids(uri_list, product_index)
 
             # Aggiorna l'oggetto con i risultati
             query_obj["llm_sparql"] = sparql_query
@@ -284,4 +260,16 @@ for filename in os.listdir(json_folder):
         with open(new_file_path, 'w') as f:
             json.dump(updated_data, f, indent=4)
 
+        # Salva le query scartate, da rivedere o rieseguire
+        if dead_letters:
+            dead_letter_path = os.path.join(json_folder, f"{os.path.splitext(filename)[0]}_LLM_scartate.json")
+            with open(dead_letter_path, 'w') as f:
+                json.dump(dead_letters, f, indent=4, ensure_ascii=False)
+
+backend.close()
+if llm_cache:
+    llm_cache.close()
+total_queries = sum(parser_paths.values())
+for path, count in parser_paths.items():
+    print(f"Query interpretate da '{path}': {count} ({count / total_queries if total_queries else 0:.1%})")
 print("Elaborazione completata.")
@@ -50,12 +50,16 @@ def evaluate_performance_for_category(data, category_filter):
     text_count = 0
     llm_count = 0
     query_count = 0
+    parser_paths = {}
 
     for entry in data:
         query = entry.get("query", {})
 
         if category_filter(query):  # Applica il filtro per la categoria
             query_count += 1  # Conta le query che passano il filtro
+            # Percorso con cui è stata interpretata la query testuale (regole, cache, llm, scartate)
+            parser_path = entry.get("llm_parser", "llm")
+            parser_paths[parser_path] = parser_paths.get(parser_path, 0) + 1
             original_results = entry.get("true_results", [])
             sparql_results = entry.get("sparql_results", [])  # Usa 'sparql_results' correttamente
             text_results = entry.get("text_results", [])
@@ -105,7 +109,8 @@ def evaluate_performance_for_category(data, category_filter):
         "sparql": (avg_precision_sparql, avg_recall_sparql, avg_f1_sparql),
         "text": (avg_precision_text, avg_recall_text, avg_f1_text),
         "llm": (avg_precision_llm, avg_recall_llm, avg_f1_llm),
-        "query_count": query_count
+        "query_count": query_count,
+        "parser_paths": parser_paths
     }
 
 
@@ -148,6 +153,8 @@ def evaluate_performance(json_file, exclude_feature=None):
         f"Text - Precisione: {all_results['text'][0]:.3f}, Richiamo: {all_results['text'][1]:.3f}, F1: {all_results['text'][2]:.3f}")
     print(
         f"LLM - Precisione: {all_results['llm'][0]:.3f}, Richiamo: {all_results['llm'][1]:.3f}, F1: {all_results['llm'][2]:.3f}")
+    for parser_path, count in all_results['parser_paths'].items():
+        print(f"Query interpretate da '{parser_path}': {count / all_results['query_count']:.1%}")
 
     print(f"\nRisultati per query senza '{exclude_feature}':")
     print(f"Numero di query: {no_feature_results['query_count']}")
@@ -0,0 +1,94 @@
+import itertools
+import os
+import re
+import sys
+from tabelle import CORPUS_FILE, load_table
+
+# Gruppi olfattivi e separatori delle categorie sono quelli usati per normalizzare i dati indicizzati
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Raffinamento'))
+from arricchimento import OLFACTORY_GROUPS, split_categories
+
+# Campi dell'output, nello stesso ordine della lista prodotta dall'LLM in llm_sparql.py
+FIELDS = ['brand', 'category', 'capacity', 'olfactory category', 'price']
+
+# Prezzo massimo nel formato generato da text_queries.py ("minori di 30 euro")
+PRICE_PATTERN = re.compile(r'\b(?:minori|meno) di (\d+) euro\b')
+
+
+class VocabularyMatcher:
+    """
+    Matcher deterministico per le query testuali a vocabolario chiuso: un trie sulle sequenze di
+    parole dei valori noti (brand, categorie, capacità, gruppi olfattivi e loro coppie) letto da
+    sinistra a destra scegliendo sempre la corrispondenza più lunga. Una query è risolta solo se
+    ogni parola appartiene a una corrispondenza non ambigua e ogni campo compare al più una volta.
+    """
+
+    def __init__(self, vocabulary):
+        self.trie = {}
+        for field, values in vocabulary.items():
+            for value in values:
+                node = self.trie
+                for token in value.lower().split():
+                    node = node.setdefault(token, {})
+                # A parità di testo vale il primo valore del campo (il più frequente nel corpus)
+                matches = node.setdefault(None, {})
+                matches.setdefault(field, value)
+
+    def longest_match(self, tokens, start):
+        node = self.trie
+        best = None
+        for end in range(start, len(tokens)):
+            node = node.get(tokens[end])
+            if node is None:
+                break
+            if None in node:
+                best = (end + 1, node[None])
+        return best
+
+    def parse(self, text_query):
+        """
+        Restituisce la lista [[campo, valore], ...] nello stesso formato dell'LLM, oppure None
+        se la query non è risolvibile interamente con il vocabolario.
+        """
+        fields = dict.fromkeys(FIELDS, "")
+        text = text_query.lower()
+        prices = PRICE_PATTERN.findall(text)
+        if len(prices) > 1:
+            return None
+        if prices:
+            fields['price'] = f"< {prices[0]}"
+            text = PRICE_PATTERN.sub(' ', text)
+
+        tokens = text.split()
+        position = 0
+        while position < len(tokens):
+            match = self.longest_match(tokens, position)
+            if match is None:
+                return None
+            position, matches = match
+            if len(matches) > 1:
+                return None
+            (field, value), = matches.items()
+            if fields[field]:
+                return None
+            fields[field] = value
+        return [[field, fields[field]] for field in FIELDS]
+
+
+# Costruisce il vocabolario dai valori presenti nella tabella del corpus, dal più frequente;
+# le categorie sono divise come nei dati indicizzati, così ogni voce corrisponde a una tripla
+def build_vocabulary(table_file=CORPUS_FILE):
+    df = load_table(table_file, columns=['brand', 'Categorie', 'Capacita'])
+    categories = df['Categorie'].dropna().astype(str).map(split_categories).explode().dropna()
+    olfactory = OLFACTORY_GROUPS + [' '.join(pair) for pair in itertools.combinations(sorted(OLFACTORY_GROUPS), 2)]
+    return {
+        'brand': df['brand'].dropna().value_counts().index.tolist(),
+        'category': categories.value_counts().index.tolist(),
+        'capacity': df['Capacita'].dropna().value_counts().index.tolist(),
+        'olfactory category': olfactory
+    }
+
+
+# Costruisce il matcher a partire dalla tabella del corpus
+def build_matcher(table_file=CORPUS_FILE):
+    return VocabularyMatcher(build_vocabulary(table_file))
@@ -0,0 +1,104 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+
+import pandas as pd
+from tabelle import save_table, load_table
+
+# Cache delle descrizioni già pulite, indicizzata per hash del contenuto HTML
+CLEAN_CACHE_FILE = 'descrizioni_pulite.parquet'
+CHUNK_SIZE = 500
+
+# Tag il cui contenuto non fa parte del testo della descrizione
+SKIPPED_TAGS = {'script', 'style'}
+
+
+class TextExtractor(HTMLParser):
+    """
+    Estrae il testo da un frammento HTML senza costruire l'albero: gli entity vengono
+    decodificati dal parser (convert_charrefs) e il contenuto di script e style viene scartato.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skipping += 1
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS and self.skipping:
+            self.skipping -= 1
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.parts.append(data)
+
+
+# Rimuove i tag HTML, decodifica gli entity e comprime gli spazi; i valori non testuali restano invariati
+def clean_html(html_content):
+    if not isinstance(html_content, str):
+        return html_content
+    if '<' not in html_content and '&' not in html_content:
+        return ' '.join(html_content.split())
+    extractor = TextExtractor()
+    extractor.feed(html_content)
+    extractor.close()
+    return ' '.join(' '.join(extractor.parts).split())
+
+
+# Pulisce un blocco di descrizioni (eseguita nei processi del pool)
+def clean_chunk(chunk):
+    return [clean_html(html_content) for html_content in chunk]
+
+
+def content_hash(html_content):
+    return hashlib.sha1(html_content.encode('utf-8')).hexdigest()
+
+
+def clean_descriptions(descriptions, workers=1, chunk_size=CHUNK_SIZE, cache_file=CLEAN_CACHE_FILE):
+    """
+    Restituisce le descrizioni pulite, nello stesso ordine. Le descrizioni già pulite in
+    un'esecuzione precedente (stesso hash del contenuto) vengono lette dalla cache; le altre,
+    una sola volta anche se ripetute, vengono pulite a blocchi, con `workers` > 1 in un pool di
+    processi: in quel caso lo script chiamante deve essere protetto da `if __name__ == '__main__'`,
+    perché i processi worker reimportano il modulo principale.
+    """
+    descriptions = list(descriptions)
+    hashes = [content_hash(html_content) if isinstance(html_content, str) else None for html_content in descriptions]
+
+    cache = {}
+    if cache_file and os.path.exists(cache_file):
+        cached = load_table(cache_file)
+        cache = dict(zip(cached['hash'], cached['text']))
+
+    missing = {}
+    for html_hash, html_content in zip(hashes, descriptions):
+        if html_hash is not None and html_hash not in cache:
+            missing.setdefault(html_hash, html_content)
+    print(f"Descrizioni da pulire: {len(missing)} (in cache: {sum(h in cache for h in hashes if h)})")
+
+    if missing:
+        contents = list(missing.values())
+        chunks = [contents[start:start + chunk_size] for start in range(0, len(contents), chunk_size)]
+        if workers > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+                cleaned = [text for chunk in executor.map(clean_chunk, chunks) for text in chunk]
+        else:
+            cleaned = [text for chunk in chunks for text in clean_chunk(chunk)]
+        cache.update(zip(missing.keys(), cleaned))
+        if cache_file:
+            save_table(pd.DataFrame({'hash': list(cache.keys()), 'text': list(cache.values())}), cache_file)
+
+    return [cache[html_hash] if html_hash is not None else html_content
+            for html_hash, html_content in zip(hashes, descriptions)]
+
+
+# Eseguito da solo pulisce in parallelo tutte le descrizioni del catalogo e popola la cache,
+# che classificazione.py riusa senza ripulire nulla
+if __name__ == '__main__':
+    df = pd.read_excel('../all_products.xlsx', sheet_name='all_products', engine='openpyxl')
+    clean_descriptions(df['post_content'], workers=os.cpu_count())
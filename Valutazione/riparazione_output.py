@@ -0,0 +1,128 @@
+import ast
+import json
+import re
+
+# Categorie olfattive della classificazione, nell'ordine dell'output
+CATEGORIES = ["Agrumato", "Ambrato", "Aromatico", "Chypre", "Cuoio", "Dolce", "Floreale", "Fruttato", "Gourmand",
+              "Legnoso", "Muschiato", "Senza Profumo", "Speziato Leggero"]
+CATEGORY_NAMES = {category.lower(): category for category in CATEGORIES}
+
+# Valori accettati per i flag, anche scritti a parole in italiano o in inglese
+FLAG_VALUES = {'1': 1, '0': 0, 'true': 1, 'false': 0, 'vero': 1, 'falso': 0, 'sì': 1, 'si': 1, 'no': 0,
+               'yes': 1, 'presente': 1, 'assente': 0}
+
+# "Categoria" seguita (con o senza virgolette, con virgola, due punti o uguale) dal suo valore
+FLAG_PATTERN = re.compile(
+    r'''["']?(%s)["']?\s*[,:=]\s*["']?(%s)\b''' % (
+        '|'.join(re.escape(category) for category in sorted(CATEGORIES, key=len, reverse=True)),
+        '|'.join(re.escape(value) for value in sorted(FLAG_VALUES, key=len, reverse=True))
+    ),
+    re.IGNORECASE
+)
+
+# Schema JSON di una classificazione, per la generazione vincolata sui modelli che la supportano
+CLASSIFICATION_SCHEMA = {
+    'type': 'object',
+    'properties': {category: {'type': 'integer', 'enum': [0, 1]} for category in CATEGORIES},
+    'required': CATEGORIES,
+    'additionalProperties': False
+}
+BATCH_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'prodotti': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {'id': {'type': 'integer'}, **CLASSIFICATION_SCHEMA['properties']},
+                'required': ['id'] + CATEGORIES,
+                'additionalProperties': False
+            }
+        }
+    },
+    'required': ['prodotti'],
+    'additionalProperties': False
+}
+
+
+# Restituisce il parametro response_format per vincolare l'output: 'json_object' (JSON mode)
+# oppure 'json_schema' (output conforme a `schema`); None se il vincolo è disattivato
+def response_format(kind, schema=BATCH_SCHEMA, name='classificazione'):
+    if kind == 'json_object':
+        return {'type': 'json_object'}
+    if kind == 'json_schema':
+        return {'type': 'json_schema', 'json_schema': {'name': name, 'schema': schema, 'strict': True}}
+    return None
+
+
+# Converte un flag (0/1, booleano o parola) in 0 o 1, oppure None se non è riconoscibile
+def normalize_flag(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, int) and value in (0, 1):
+        return value
+    if isinstance(value, str):
+        return FLAG_VALUES.get(value.strip().lower())
+    return None
+
+
+# Costruisce l'output canonico se tutte le 13 categorie hanno un flag valido
+def canonical_output(flags):
+    if any(flags.get(category) is None for category in CATEGORIES):
+        return None
+    return str([[category, flags[category]] for category in CATEGORIES])
+
+
+# Interpreta un output già strutturato: lista di coppie o dizionario categoria -> flag
+def flags_from_structure(value):
+    if isinstance(value, dict):
+        pairs = value.items()
+    elif isinstance(value, (list, tuple)) and all(isinstance(item, (list, tuple)) and len(item) == 2 for item in value):
+        pairs = value
+    else:
+        return None
+    flags = {}
+    for name, flag in pairs:
+        category = CATEGORY_NAMES.get(str(name).strip().lower())
+        if category is not None:
+            flags[category] = normalize_flag(flag)
+    return flags
+
+
+def repair_classification(text):
+    """
+    Ripara localmente l'output di una classificazione e restituisce la lista canonica
+    [["Agrumato", 0/1], ...] come stringa, oppure None se non è ricostruibile. Accetta liste Python
+    o JSON, dizionari, testo prima e dopo l'output, parentesi mancanti, virgolette diverse e
+    flag scritti a parole (vero/falso, sì/no, true/false).
+    """
+    if not isinstance(text, str):
+        text = str(text)
+    start, end = text.find('['), text.rfind(']')
+    if start == -1 or end <= start:
+        start, end = text.find('{'), text.rfind('}')
+    if start != -1 and end > start:
+        for parse in (ast.literal_eval, json.loads):
+            try:
+                flags = flags_from_structure(parse(text[start:end + 1]))
+            except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+                continue
+            if flags is not None and canonical_output(flags) is not None:
+                return canonical_output(flags)
+
+    # Altrimenti cerca le coppie categoria/valore nel testo, ovunque si trovino
+    flags = {}
+    for name, flag in FLAG_PATTERN.findall(text):
+        flags.setdefault(CATEGORY_NAMES[name.lower()], FLAG_VALUES[flag.lower()])
+    return canonical_output(flags)
+
+
+# Verifica che l'output sia già nel formato canonico: 13 coppie [categoria, 0/1] nell'ordine previsto
+def is_canonical(text):
+    try:
+        value = ast.literal_eval(text)
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        return False
+    return (isinstance(value, list) and len(value) == len(CATEGORIES) and
+            all(isinstance(item, list) and len(item) == 2 and item[0] == category and
+                isinstance(item[1], int) and item[1] in (0, 1) for item, category in zip(value, CATEGORIES)))
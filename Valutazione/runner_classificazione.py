@@ -0,0 +1,329 @@
+import ast
+import asyncio
+import json
+import os
+import pickle
+import re
+import time
+
+from esecuzione_llm import TokenBucket, rate_limit_delay
+from riparazione_output import CATEGORIES, canonical_output, flags_from_structure
+
+# Store append-only delle classificazioni, una riga JSON per prodotto
+STORE_FILE = 'classificazioni.jsonl'
+
+# Parametri predefiniti del runner
+CONCURRENCY = 8
+REQUESTS_PER_SECOND = 0.5
+MAX_ATTEMPTS = 10
+MAX_RATE_LIMITED = 50
+TRUNCATED_LENGTH = 300
+
+# Modalità batch: più descrizioni per prompt, finché la stima dei token resta nel budget
+TOKEN_BUDGET = 6000
+CONTEXT_LIMIT = 8192
+MAX_BATCH_SIZE = 50
+CHARS_PER_TOKEN = 4
+# Token stimati della risposta per ogni prodotto (13 flag in JSON)
+OUTPUT_TOKENS_PER_ITEM = 90
+# Singolo oggetto di un record, per leggere i record uno a uno quando l'array non è valido
+RECORD_PATTERN = re.compile(r'\{[^{}]*\}')
+
+# Output usato per i prodotti che non è stato possibile classificare
+FALLBACK_OUTPUT = str([[category, 0] for category in CATEGORIES])
+
+
+# Legge le classificazioni già salvate ({ID: output}); una riga finale incompleta,
+# lasciata da un'interruzione durante la scrittura, viene scartata e troncata
+def load_store(store_file=STORE_FILE):
+    results = {}
+    if not os.path.exists(store_file):
+        return results
+    valid_size = 0
+    with open(store_file, 'rb') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            results[record['ID']] = record['output']
+            valid_size += len(line)
+    if valid_size < os.path.getsize(store_file):
+        with open(store_file, 'r+b') as f:
+            f.truncate(valid_size)
+    return results
+
+
+# Aggiunge una classificazione allo store e la rende persistente
+def append_to_store(f, product_id, output, attempts):
+    f.write(json.dumps({'ID': product_id, 'output': output, 'attempts': attempts}, ensure_ascii=False) + '\n')
+    f.flush()
+    os.fsync(f.fileno())
+
+
+# Importa nello store le classificazioni salvate dalla versione precedente in `cat.pickle`,
+# una per prodotto nell'ordine della tabella
+def migrate_pickle(pickle_file, product_ids, store_file=STORE_FILE):
+    if os.path.exists(store_file) or not os.path.exists(pickle_file):
+        return
+    with open(pickle_file, 'rb') as file:
+        cat = pickle.load(file)
+    with open(store_file, 'a', encoding='utf-8') as f:
+        for product_id, output in zip(product_ids, cat):
+            append_to_store(f, product_id, output if isinstance(output, str) else str(output), 0)
+    print(f"Importate {min(len(cat), len(product_ids))} classificazioni da '{pickle_file}'")
+
+
+async def classify_description(chain, description, limiter, max_attempts=MAX_ATTEMPTS):
+    """
+    Classifica una descrizione: in caso di contesto troppo lungo la tronca (una volta), sui 429
+    sospende il rate limiter per il Retry-After e ritenta, sugli altri errori ritenta fino a
+    `max_attempts` volte e poi restituisce l'output di fallback.
+    """
+    attempts = 0
+    rate_limited = 0
+    while attempts < max_attempts:
+        await limiter.acquire()
+        try:
+            result = await chain.ainvoke(description)
+            return result.content, attempts + 1
+        except Exception as e:
+            error_message = str(e)
+            delay = rate_limit_delay(e)
+            if delay is not None and rate_limited < MAX_RATE_LIMITED:
+                rate_limited += 1
+                limiter.block(delay)
+            elif 'context_length_exceeded' in error_message and len(description) > TRUNCATED_LENGTH:
+                description = description[:TRUNCATED_LENGTH]
+                print(f"Context length exceeded. Ridotto a {TRUNCATED_LENGTH} caratteri.")
+            elif 'internal_server_error' in error_message:
+                attempts += 1
+                await asyncio.sleep(1)
+            else:
+                attempts += 1
+                print(f"Errore generale (tentativo={attempts}): {e}")
+                await asyncio.sleep(1)
+    print("Numero massimo di tentativi raggiunto. Aggiungo valore di fallback.")
+    return FALLBACK_OUTPUT, attempts
+
+
+async def classify_pending(chain, items, store_file, concurrency, rate):
+    # Classifica gli elementi (ID, descrizione) con al più `concurrency` richieste in volo,
+    # scrivendo ogni risultato nello store appena disponibile
+    limiter = TokenBucket(rate, capacity=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {}
+
+    with open(store_file, 'a', encoding='utf-8') as f:
+        async def run(product_id, description):
+            async with semaphore:
+                output, attempts = await classify_description(chain, description, limiter)
+            append_to_store(f, product_id, output, attempts)
+            results[product_id] = output
+            if len(results) % 100 == 0:
+                print(f"Classificati {len(results)} prodotti su {len(items)}")
+
+        await asyncio.gather(*(run(product_id, description) for product_id, description in items))
+    return results
+
+
+def classify_products(chain, product_ids, descriptions, store_file=STORE_FILE, concurrency=CONCURRENCY,
+                      rate=REQUESTS_PER_SECOND):
+    """
+    Classifica tutte le descrizioni, riprendendo automaticamente dallo store: vengono inviati
+    all'LLM solo i prodotti il cui ID non ha ancora una classificazione. Restituisce {ID: output}.
+    """
+    results = load_store(store_file)
+    items = [(product_id, description if isinstance(description, str) else '')
+             for product_id, description in zip(product_ids, descriptions) if product_id not in results]
+    print(f"{len(results)} prodotti già classificati, {len(items)} da classificare")
+
+    if items:
+        start = time.perf_counter()
+        results.update(asyncio.run(classify_pending(chain, items, store_file, concurrency, rate)))
+        elapsed = time.perf_counter() - start
+        print(f"Classificati {len(items)} prodotti in {elapsed:.1f} s ({len(items) / elapsed:.2f} prodotti/s)")
+    return results
+
+
+# Stima grossolana dei token di un testo (circa 4 caratteri per token)
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+# Divide gli elementi in batch: ogni batch si chiude quando la stima dei token di input e di output
+# supererebbe il budget (al netto del prompt), quindi K si adatta alla lunghezza delle descrizioni
+def plan_batches(items, prompt_tokens, token_budget=TOKEN_BUDGET, context_limit=CONTEXT_LIMIT,
+                 max_batch_size=MAX_BATCH_SIZE):
+    budget = min(token_budget, context_limit) - prompt_tokens
+    batches = []
+    batch = []
+    used = 0
+    for product_id, description in items:
+        cost = estimate_tokens(description) + OUTPUT_TOKENS_PER_ITEM
+        if batch and (used + cost > budget or len(batch) >= max_batch_size):
+            batches.append(batch)
+            batch = []
+            used = 0
+        batch.append((product_id, description))
+        used += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+# Legge i record della risposta: l'array intero in JSON o come letterale Python, altrimenti
+# ogni oggetto {...} separatamente, così un record malformato non invalida gli altri
+def batch_records(text):
+    start, end = text.find('['), text.rfind(']')
+    if start != -1 and end > start:
+        for parse in (json.loads, ast.literal_eval):
+            try:
+                records = parse(text[start:end + 1])
+            except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+                continue
+            if isinstance(records, list):
+                return records
+    records = []
+    for match in RECORD_PATTERN.finditer(text):
+        for parse in (json.loads, ast.literal_eval):
+            try:
+                records.append(parse(match.group()))
+                break
+            except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+                continue
+    return records
+
+
+def parse_batch_output(text, product_ids):
+    """
+    Estrae dalla risposta i record [{"id": ..., "Agrumato": 0, ...}, ...] e restituisce
+    {ID: output canonico} per quelli con un ID del batch e tutte le 13 categorie; nomi delle
+    categorie e flag vengono normalizzati dalla riparazione locale ("1", "true", "vero" valgono 1).
+    I record non ricostruibili restano fuori e tornano in coda.
+    """
+    ids_by_key = {str(product_id): product_id for product_id in product_ids}
+    parsed = {}
+    for record in batch_records(text):
+        if not isinstance(record, dict) or str(record.get('id')).strip() not in ids_by_key:
+            continue
+        output = canonical_output(flags_from_structure(record))
+        if output is not None:
+            parsed[ids_by_key[str(record['id']).strip()]] = output
+    return parsed
+
+
+async def classify_pending_batched(batch_chain, items, store_file, concurrency, rate, prompt_tokens,
+                                   token_budget, context_limit, max_attempts=MAX_ATTEMPTS):
+    """
+    Classifica gli elementi a batch: ogni batch è un'unica richiesta con le descrizioni in JSON.
+    I prodotti assenti o malformati nella risposta tornano in coda per il turno successivo, fino a
+    `max_attempts` tentativi; un errore di contesto troppo lungo dimezza il budget dei batch e,
+    per un batch di un solo prodotto, tronca la descrizione a `TRUNCATED_LENGTH` caratteri.
+    Restituisce {ID: output} e le statistiche per dimensione del batch.
+    """
+    limiter = TokenBucket(rate, capacity=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {}
+    attempts = {product_id: 0 for product_id, _ in items}
+    rate_limited = {product_id: 0 for product_id, _ in items}
+    stats = {}
+
+    async def run(batch):
+        product_ids = [product_id for product_id, _ in batch]
+        payload = json.dumps([{'id': product_id, 'descrizione': description} for product_id, description in batch],
+                             ensure_ascii=False)
+        async with semaphore:
+            await limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = await batch_chain.ainvoke({'prodotti': payload})
+            except Exception as e:
+                delay = rate_limit_delay(e)
+                if delay is not None:
+                    limiter.block(delay)
+                    return {}, 'rate_limited'
+                print(f"Errore nel batch di {len(batch)} prodotti: {e}")
+                return {}, 'too_long' if 'context_length_exceeded' in str(e) else 'error'
+            elapsed = time.perf_counter() - start
+
+        parsed = parse_batch_output(response.content, product_ids)
+        usage = getattr(response, 'usage_metadata', None) or {}
+        tokens = usage.get('total_tokens') or (prompt_tokens + estimate_tokens(payload) +
+                                               estimate_tokens(response.content))
+        size_stats = stats.setdefault(len(batch), {'batches': 0, 'items': 0, 'failures': 0, 'tokens': 0,
+                                                   'elapsed': 0.0})
+        size_stats['batches'] += 1
+        size_stats['items'] += len(batch)
+        size_stats['failures'] += len(batch) - len(parsed)
+        size_stats['tokens'] += tokens
+        size_stats['elapsed'] += elapsed
+        return parsed, 'ok'
+
+    pending = list(items)
+    with open(store_file, 'a', encoding='utf-8') as f:
+        while pending:
+            batches = plan_batches(pending, prompt_tokens, token_budget, context_limit)
+            outcomes = await asyncio.gather(*(run(batch) for batch in batches))
+            pending = []
+            for batch, (parsed, outcome) in zip(batches, outcomes):
+                if outcome == 'too_long':
+                    token_budget = max(prompt_tokens + OUTPUT_TOKENS_PER_ITEM, token_budget // 2)
+                for product_id, description in batch:
+                    # Un prodotto da solo ancora troppo lungo viene troncato, come nel percorso singolo
+                    if outcome == 'too_long' and len(batch) == 1 and len(description) > TRUNCATED_LENGTH:
+                        print(f"Context length exceeded. Ridotto a {TRUNCATED_LENGTH} caratteri.")
+                        pending.append((product_id, description[:TRUNCATED_LENGTH]))
+                        continue
+                    # I batch rifiutati per rate limit non consumano tentativi, fino a MAX_RATE_LIMITED
+                    # rifiuti per prodotto: oltre (ad esempio a quota esaurita) contano come errori
+                    if outcome == 'rate_limited':
+                        rate_limited[product_id] += 1
+                        attempts[product_id] += rate_limited[product_id] > MAX_RATE_LIMITED
+                    else:
+                        attempts[product_id] += 1
+                    if product_id in parsed:
+                        output = parsed[product_id]
+                    elif attempts[product_id] < max_attempts:
+                        pending.append((product_id, description))
+                        continue
+                    else:
+                        output = FALLBACK_OUTPUT
+                    append_to_store(f, product_id, output, attempts[product_id])
+                    results[product_id] = output
+            if pending:
+                print(f"Classificati {len(results)} prodotti su {len(items)}, {len(pending)} rimessi in coda")
+    return results, stats
+
+
+# Stampa per ogni dimensione del batch token/s, prodotti/s e tasso di risposte non interpretabili
+def print_batch_stats(stats):
+    for size in sorted(stats):
+        size_stats = stats[size]
+        elapsed = size_stats['elapsed'] or 1e-9
+        print(f"K={size:3d}: {size_stats['batches']} batch, {size_stats['tokens'] / elapsed:8.1f} token/s, "
+              f"{size_stats['items'] / elapsed:6.2f} prodotti/s, "
+              f"parse falliti {size_stats['failures'] / size_stats['items']:.1%}")
+
+
+def classify_products_batched(batch_chain, product_ids, descriptions, prompt_tokens, store_file=STORE_FILE,
+                              concurrency=CONCURRENCY, rate=REQUESTS_PER_SECOND, token_budget=TOKEN_BUDGET,
+                              context_limit=CONTEXT_LIMIT):
+    """
+    Come classify_products, ma con più descrizioni per richiesta (vedi classify_pending_batched).
+    `prompt_tokens` è la stima dei token del prompt senza le descrizioni.
+    """
+    results = load_store(store_file)
+    items = [(product_id, description if isinstance(description, str) else '')
+             for product_id, description in zip(product_ids, descriptions) if product_id not in results]
+    print(f"{len(results)} prodotti già classificati, {len(items)} da classificare")
+
+    if items:
+        start = time.perf_counter()
+        batch_results, stats = asyncio.run(classify_pending_batched(
+            batch_chain, items, store_file, concurrency, rate, prompt_tokens, token_budget, context_limit))
+        results.update(batch_results)
+        elapsed = time.perf_counter() - start
+        print(f"Classificati {len(items)} prodotti in {elapsed:.1f} s ({len(items) / elapsed:.2f} prodotti/s)")
+        print_batch_stats(stats)
+    return results
@@ -1,120 +1,138 @@
 import json
-import requests
-import pandas as pd
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from indice_prodotti import load_index, extract_uris, map_uris_to_ids
+from backend_sparql import create_backend, FUSEKI_URL, TTL_FILE
+from costruttore_query import generate_sparql_query, generate_batch_query, normalize_query_input, query_shape
+from cache_risultati import cached_backend
 import os
 import subprocess
 import csv
 
-# URL del server Fuseki e file Excel con la mappatura URI -> ID
-FUSEKI_URL = "http://localhost:3030/ds"
-EXCEL_FILE = 'prodotti_finale.xlsx'
+# Backend SPARQL: 'http' interroga il server Fuseki, 'local' carica il file Turtle in-process
+SPARQL_BACKEND = 'http'
+
+# Cartelle di lavoro
 EXPORT_DIR = r'C:\Users\franr\Desktop\Repo Sidea\ETHOS\Repo Ethos\ecommerce\ethos\query_exports'
 QUERIES_DIR = 'query_combinazioni'
 
+# Numero massimo di query in volo verso Fuseki e timeout (in secondi) di ogni query
+CONCURRENCY = 8
+QUERY_TIMEOUT = 30
+
+# Modalità batch: le combinazioni con la stessa forma vengono risolte con una sola query
+# (al più BATCH_SIZE combinazioni per query, legate con VALUES e distinte da ?qid)
+BATCHED = True
+BATCH_SIZE = 200
+
+# Cache persistente dei risultati: la chiave include l'hash del file Turtle (quello caricato
+# in Fuseki o nel backend locale), quindi rigenerare il dataset invalida le voci precedenti.
+# Se il file Turtle non è disponibile (Fuseki caricato altrove) va indicata la versione del dataset,
+# altrimenti la cache viene disattivata
+RESULT_CACHE = True
+DATASET_VERSION = None
+
+BACKEND_OPTIONS = {
+    'http': {'url': FUSEKI_URL, 'pool_size': CONCURRENCY, 'timeout': QUERY_TIMEOUT},
+    'local': {'ttl_file': TTL_FILE}
+}
+
 # Funzione per caricare le query da un file JSON
 def load_queries(json_file):
     with open(json_file, 'r') as f:
         return json.load(f)
 
-# Funzione per generare la query SPARQL
-def generate_sparql_query(query_input):
-    category_clause = generate_category_clause(query_input.get("category"))
-    capacity_clause = generate_capacity_clause(query_input.get("capacity"))
-    brand_clause = generate_brand_clause(query_input.get("brand"))
-    olfactory_category_clause = generate_olfactory_category_clause(query_input.get("olfactory_category"))
-    price_clause = generate_price_clause(query_input.get("price"))
-
-    offer_clause = "?product schema:offers ?offer ." if query_input.get("price") else ""
-
-    sparql_query = f"""
-    PREFIX schema: <http://schema.org/>
-    PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
-
-    SELECT ?product
-    WHERE {{
-      ?product a schema:Product ;
-               schema:name ?name .
-      {offer_clause}
-      {category_clause}
-      {capacity_clause}
-      {brand_clause}
-      {olfactory_category_clause}
-      {price_clause}
-    }}
-    """
-    return sparql_query.strip()
-
-# Clausole SPARQL
-def generate_category_clause(category):
-    return f' ?product schema:category ?category . FILTER(CONTAINS(?category, "{category}")) ' if category else ""
-
-def generate_capacity_clause(capacity):
-    return f' ?product schema:additionalProperty [ a schema:PropertyValue ; schema:name "Capacita" ; schema:value "{capacity}" ] . ' if capacity else ""
-
-def generate_brand_clause(brand):
-    return f' ?product schema:brand [ a schema:Brand ; schema:name "{brand}" ] . ' if brand else ""
-
-def generate_olfactory_category_clause(olfactory_category):
-    return f' ?product schema:additionalProperty [ a schema:PropertyValue ; schema:name "Gruppo Olfattivo" ; schema:value ?olfattivo ] . FILTER(CONTAINS(?olfattivo, "{olfactory_category}")) ' if olfactory_category else ""
-
-def generate_price_clause(price):
-    if price:
-        max_price = price.replace("<", "").strip()
-        return f'''
-        ?offer schema:price ?price ;
-               schema:priceCurrency ?currency .
-        FILTER(xsd:decimal(?price) < {max_price})
-        '''
-    return ""
-
-# Esegue la query SPARQL sul server Fuseki
-def execute_sparql_query(query):
-    try:
-        response = requests.get(FUSEKI_URL, params={'query': query, 'format': 'json'})
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Errore durante l'esecuzione della query: {e}")
-        return None
-
-# Estrazione di URI dai risultati SPARQL
-def extract_uris(sparql_results):
-    uris = []
-    if sparql_results and "results" in sparql_results and "bindings" in sparql_results["results"]:
-        for binding in sparql_results["results"]["bindings"]:
-            if "product" in binding and "value" in binding["product"]:
-                uri = binding["product"]["value"].replace('/#richSnippet', '')
-                uris.append(uri)
-    return uris
-
-# Caricamento della mappatura URI -> ID dal file Excel
-def load_excel_mapping(excel_file):
-    df = pd.read_excel(excel_file)
-    mapping = dict(zip(df['permalink'], df['ID']))
-    return mapping
-
-# Mappa gli URI agli ID
-def map_uris_to_ids(uris, mapping):
-    ids = [mapping.get(uri, None) for uri in uris]
-    return sorted(id for id in ids if id is not None)
+# Esegue la query SPARQL sul backend configurato (Fuseki o store locale)
+def execute_sparql_query(query, backend):
+    return backend.query(query)
+
+# Esegue un insieme di query con al più `concurrency` query in volo sullo stesso backend,
+# restituendo i risultati nell'ordine delle query e le statistiche di throughput e latenza
+def execute_sparql_batch(queries, backend, concurrency=CONCURRENCY):
+    def timed_query(query):
+        start = time.perf_counter()
+        result = execute_sparql_query(query, backend)
+        return result, time.perf_counter() - start
+
+    if backend.max_concurrency:
+        concurrency = min(concurrency, backend.max_concurrency)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        timed_results = list(executor.map(timed_query, queries))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for _, latency in timed_results)
+    stats = {
+        'queries': len(queries),
+        'errors': sum(1 for result, _ in timed_results if result is None),
+        'elapsed': elapsed,
+        'throughput': len(queries) / elapsed if elapsed > 0 else 0,
+        'latency_mean': statistics.mean(latencies) if latencies else 0,
+        'latency_p50': latencies[len(latencies) // 2] if latencies else 0,
+        'latency_p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0
+    }
+    return [result for result, _ in timed_results], stats
+
+# Risolve le combinazioni raggruppandole per forma: ogni gruppo viene diviso in batch da
+# `batch_size` combinazioni, ciascun batch diventa una query con VALUES e i binding restituiti
+# vengono ridistribuiti alle singole combinazioni in base a ?qid
+def execute_sparql_batched(query_inputs, backend, batch_size=BATCH_SIZE, concurrency=CONCURRENCY):
+    groups = {}
+    for position, query_input in enumerate(query_inputs):
+        shape = query_shape(normalize_query_input(query_input))
+        groups.setdefault(shape, []).append(position)
+
+    batches = []
+    for positions in groups.values():
+        for start in range(0, len(positions), batch_size):
+            batches.append(positions[start:start + batch_size])
+
+    batch_queries = [generate_batch_query([query_inputs[position] for position in batch]) for batch in batches]
+    batch_results, stats = execute_sparql_batch(batch_queries, backend, concurrency)
+
+    # Demultiplexing: ogni combinazione riceve i binding con il proprio ?qid
+    results = [None] * len(query_inputs)
+    for batch, batch_result in zip(batches, batch_results):
+        if batch_result is None:
+            continue
+        bindings = [[] for _ in batch]
+        for binding in batch_result["results"]["bindings"]:
+            bindings[int(binding["qid"]["value"])].append(binding)
+        for position, entry_bindings in zip(batch, bindings):
+            results[position] = {"results": {"bindings": entry_bindings}}
+    stats['combinations'] = len(query_inputs)
+    return results, stats
 
 # Esecuzione e salvataggio dei risultati delle query
-def process_json(input_file, output_file):
+def process_json(input_file, output_file, backend):
     with open(input_file, 'r') as file:
         data = json.load(file)
     
-    uri_to_id_mapping = load_excel_mapping(EXCEL_FILE)
+    # Indice permalink -> ID, costruito e caricato una sola volta per processo
+    product_index = load_index()
     results = []
-    
-    for entry in data:
+
+    # Genera tutte le query del file e le esegue in parallelo sul backend,
+    # eventualmente raggruppando le combinazioni con la stessa forma in query batch
+    sparql_queries = [generate_sparql_query(entry.get("query")) for entry in data]
+    if BATCHED:
+        all_sparql_results, stats = execute_sparql_batched([entry.get("query") for entry in data], backend)
+        print(f"{stats['combinations']} combinazioni risolte con {stats['queries']} query batch")
+    else:
+        all_sparql_results, stats = execute_sparql_batch(sparql_queries, backend)
+    print(f"Eseguite {stats['queries']} query in {stats['elapsed']:.2f} s "
+          f"({stats['throughput']:.1f} query/s, errori: {stats['errors']}). "
+          f"Latenza media {stats['latency_mean'] * 1000:.1f} ms, "
+          f"p50 {stats['latency_p50'] * 1000:.1f} ms, p95 {stats['latency_p95'] * 1000:.1f} ms")
+
+    for entry, sparql_query, sparql_results in zip(data, sparql_queries, all_sparql_results):
         query_input = entry.get("query")
         original_results = entry.get("results")
-        
-        sparql_query = generate_sparql_query(query_input)
-        sparql_results = execute_sparql_query(sparql_query)
-        
+
         uri_list = extract_uris(sparql_results) if sparql_results else []
-        id_list = map_uris_to_ids(uri_list, uri_to_id_mapping)
+        id_list = map_uris_to_ids(uri_list, product_index)
         
         results.append({
             "query": query_input,
@@ -130,12 +148,16 @@ def process_json(input_file, output_file):
 
 # Esecuzione di tutti i file JSON
 def process_all_json_files(input_dir, output_dir):
+    backend = create_backend(SPARQL_BACKEND, **BACKEND_OPTIONS[SPARQL_BACKEND])
+    if RESULT_CACHE:
+        backend = cached_backend(backend, TTL_FILE, DATASET_VERSION)
     for filename in os.listdir(input_dir):
         if filename.endswith('.json'):
             input_file = os.path.join(input_dir, filename)
             output_file = os.path.join(output_dir, f"{os.path.splitext(filename)[0]}_SPARQL.json")
             print(f"Elaborazione del file: {input_file}")
-            process_json(input_file, output_file)
+            process_json(input_file, output_file, backend)
+    backend.close()
 
 # Salvataggio dei dati in JSON
 def export_to_json(data, output_file):
@@ -0,0 +1,40 @@
+import pandas as pd
+import pyarrow as pa
+
+# Tabella finale del corpus, letta da ground_truth.py, sparql_queries.py e llm_sparql.py
+CORPUS_FILE = 'prodotti_finale.parquet'
+
+
+# Converte in testo le colonne object che Arrow non sa rappresentare perché hanno valori
+# di tipi diversi (ad esempio SKU numerici e alfanumerici negli export di WooCommerce);
+# le celle vuote restano vuote e le altre colonne non vengono toccate
+def arrow_compatible(df):
+    mixed = []
+    for column in df.columns:
+        if df[column].dtype == object:
+            try:
+                pa.array(df[column], from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                mixed.append(column)
+    if not mixed:
+        return df
+    print(f"Colonne con tipi misti salvate come testo: {', '.join(map(str, mixed))}")
+    df = df.copy()
+    for column in mixed:
+        df[column] = df[column].map(lambda value: value if value is None or value != value else str(value))
+    return df
+
+
+# Salva una tabella intermedia in formato Parquet, con i tipi delle colonne conservati
+def save_table(df, parquet_file, excel_report=None):
+    arrow_compatible(df).to_parquet(parquet_file, index=False)
+    print(f"Tabella salvata in '{parquet_file}'")
+    # L'export Excel è solo un report opzionale e non viene più riletto dalla pipeline
+    if excel_report:
+        df.to_excel(excel_report, index=False)
+        print(f"Report Excel salvato in '{excel_report}'")
+
+
+# Legge una tabella intermedia mappando il file in memoria, senza copie dei buffer Arrow
+def load_table(parquet_file, columns=None):
+    return pd.read_parquet(parquet_file, columns=columns, memory_map=True)